@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import platform
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+import cfbind
+import mpiheader
+from mpigen import MPI_Output_sink, add_common_arguments, add_output_argument, generate
+from mpiiface import MPI_Interface
+
+STUB_DIR = os.path.join(BENCH_DIR, "fbind")
+
+# Wrappers called by fbind/bench_fbind.c
+FUNCTIONS = ["MPI_Send", "MPI_Waitall", "MPI_Alltoallw", "MPI_Info_set"]
+
+# Types with a definition in fbind/include/mpc_mpi.h
+STUB_TYPES = {"MPI_Fint", "MPI_Aint", "MPI_Count", "MPI_Offset",
+              "MPI_Comm", "MPI_Datatype", "MPI_Request", "MPI_Info", "MPI_Op",
+              "MPI_Group", "MPI_Win", "MPI_File", "MPI_Errhandler", "MPI_Message",
+              "MPI_Session", "MPI_Status", "MPI_F08_status",
+              "MPI_Comm_copy_attr_function", "MPI_Comm_delete_attr_function"}
+
+
+def gen_stub_types(functions):
+    # Other types used by the generated header are opaque integers
+    names = set()
+    for f in functions:
+        for ctype in [f.return_type()] + [p.kind_expand() for p in f.params()]:
+            names.update(re.findall(r"\bMPI_\w+", ctype))
+    return "".join("typedef int {};\n".format(n) for n in sorted(names - STUB_TYPES))
+
+
+def gen_c_stubs(functions):
+    # Out of line so the calls are not optimized away
+    ret = "#include <mpc_mpi.h>\n\n"
+    for f in functions:
+        ret += "{}\n{{\n\treturn MPI_SUCCESS;\n}}\n\n".format(f.proto())
+    return ret
+
+
+def gen_bench_header(iface):
+    ret = "#ifndef CHAR_END\n"
+    ret += "\t#define CHAR_END(thename) ,long int thename\n"
+    ret += "\t#define CHAR_MIXED(thename)\n"
+    ret += "#endif\n\n"
+    for name in FUNCTIONS:
+        f = iface.functions[name]
+        # Types as seen from Fortran, handles are integers
+        for p in f.parameters:
+            if p.kind() in ("BUFFER", "STRING", "STATUS", "ERROR_CODE"):
+                continue
+            ctype = "MPI_Fint" if p.ishandle() else p.kind_expand()
+            ret += "typedef {} bench_{}_{}_t;\n".format(ctype, f.name(), p.name())
+        ret += cfbind.fortran_proto(f) + ";\n\n"
+    return ret
+
+
+def build(args, build_dir):
+    # The wrappers are built against the header of mpiheader.py
+    header = mpiheader.backend(args)
+    b = cfbind.backend(args)
+
+    with open(args.datafile.name) as f:
+        c_iface = MPI_Interface(f, header.meta)
+
+    missing = [name for name in FUNCTIONS if name not in c_iface.functions]
+    if missing:
+        raise SystemExit("Functions missing from the prepass: {}".format(", ".join(missing)))
+
+    # Only generate the benchmarked functions
+    for backend in (header, b):
+        keep = backend.filter_callback
+        backend.filter_callback = lambda f, keep=keep: keep(f) and f.name() in FUNCTIONS
+    with open(args.datafile.name) as f:
+        generate(f, [header, b], [os.path.join(build_dir, "gen_header.h"), os.path.join(build_dir, "fbind.c")])
+    f_iface = c_iface.rebind(b.meta)
+
+    # C functions called by the wrappers, large count (_c) ones included
+    c_functions = [c_iface.functions[name] for name in FUNCTIONS]
+    c_functions += [large for large in [f.large_count_variant(header.large_count) for f in c_functions] if large]
+
+    for name, text in (("gen_types.h", gen_stub_types(c_functions)),
+                       ("stubs.c", gen_c_stubs(c_functions)),
+                       ("fbind_bench.h", gen_bench_header(f_iface))):
+        with MPI_Output_sink(os.path.join(build_dir, name)) as out:
+            out.write(text)
+
+    binary = os.path.join(build_dir, "bench_fbind")
+    cmd = [args.cc] + shlex.split(args.cflags) + [
+        "-I", os.path.join(STUB_DIR, "include"), "-I", build_dir,
+        "-o", binary,
+        os.path.join(STUB_DIR, "bench_fbind.c"),
+        os.path.join(STUB_DIR, "stub_mpi.c"),
+        os.path.join(build_dir, "stubs.c"),
+        os.path.join(build_dir, "fbind.c")]
+    subprocess.run(cmd, check=True)
+    return binary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fortran wrappers per call overhead benchmark')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    cfbind.add_arguments(parser)
+    parser.add_argument('--cc', default=os.environ.get("CC", "gcc"), metavar="CC", type=str, help='C compiler (defaults to $CC or gcc)')
+    parser.add_argument('--cflags', default="-O2", metavar="FLAGS", type=str, help='Flags used to build the wrappers and the stub runtime')
+    parser.add_argument('--build-dir', default=None, metavar="DIR", type=str, help='Keep the generated sources and binary in this directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_dir = args.build_dir or tmp
+        os.makedirs(build_dir, exist_ok=True)
+        binary = build(args, build_dir)
+        run = subprocess.run([binary], check=True, stdout=subprocess.PIPE, universal_newlines=True)
+
+    report = {"python": platform.python_version(),
+              "machine": platform.machine(),
+              "cc": args.cc,
+              "cflags": args.cflags,
+              "options": {"identity_handles": args.identity_handles,
+                          "handle_stack_len": args.handle_stack_len,
+                          "string_stack_len": args.string_stack_len},
+              "results": [json.loads(l) for l in run.stdout.splitlines() if l.strip()]}
+    with MPI_Output_sink(args.output or sys.stdout) as out:
+        out.write(json.dumps(report, indent=4) + "\n")
@@ -0,0 +1,68 @@
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cfbind
+import mpiheader
+import mpijson
+from mpigen import add_common_arguments, generate
+from mpiiface import MPI_Interface, MPI_Standard_meta
+
+
+def measure_model(path, repeat):
+    # Memory retained by the model once the prepass is parsed
+    with open(path) as f:
+        gc.collect()
+        tracemalloc.start()
+        iface = MPI_Interface(f, MPI_Standard_meta(lang="fbind"))
+        mem, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    nparams = sum(len(f.parameters) for f in iface.functions.values())
+
+    load = []
+    for _ in range(repeat):
+        with open(path) as f:
+            start = time.perf_counter()
+            MPI_Interface(f, MPI_Standard_meta(lang="fbind"))
+            load.append(time.perf_counter() - start)
+
+    return {"functions": len(iface.functions), "parameters": nparams,
+            "model_bytes": mem, "load_s": min(load)}
+
+
+def measure_generate(path, args, repeat):
+    # All the backends in a single pass, output kept in memory
+    gen = []
+    for _ in range(repeat):
+        backends = [mpiheader.backend(args), cfbind.backend(args),
+                    mpijson.backend(args), mpiheader.doxygen_backend(args)]
+        outputs = [io.StringIO() for _ in backends]
+        with open(path) as f:
+            start = time.perf_counter()
+            generate(f, backends, outputs, jobs=args.jobs)
+            gen.append(time.perf_counter() - start)
+    return {"generate_s": min(gen), "output_bytes": sum(len(o.getvalue()) for o in outputs)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI model and generation benchmark')
+    add_common_arguments(parser)
+    cfbind.add_arguments(parser)
+    parser.add_argument('--repeat', default=5, metavar="N", type=int, help='Keep the best of N runs (defaults to 5)')
+    args = parser.parse_args()
+
+    path = args.datafile.name
+    args.datafile.close()
+
+    result = {"datafile": path}
+    result.update(measure_model(path, args.repeat))
+    result.update(measure_generate(path, args, args.repeat))
+    json.dump(result, sys.stdout, indent=4)
+    sys.stdout.write("\n")
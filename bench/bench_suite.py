@@ -0,0 +1,173 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from glob import glob
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+import cfbind
+import mpiheader
+import mpijson
+from mpigen import MPI_Output_sink, add_common_arguments, add_output_argument, generate
+from mpiiface import MPI_Interface, MPI_Standard_meta
+
+BACKENDS = {
+    "header": mpiheader.backend,
+    "fbind": cfbind.backend,
+    "json": mpijson.backend,
+}
+
+# Functions the generators special-case by name, they are kept as they
+# are but not used to make up or replicate other functions
+SPECIAL = ["MPI_Sizeof", "MPI_F_sync_reg", "MPI_Init", "MPI_Init_thread",
+           "MPI_Wtime", "MPI_Wtick"]
+
+
+def clean_mpi_name(name):
+    # Same as utils/gen.py, MPI_COMM_RANK is MPI_Comm_rank
+    lname = name.lower()
+    return "MPI_" + lname[4].upper() + lname[5:]
+
+
+def load_revisions(utils_dir):
+    ret = {}
+    for path in glob(os.path.join(utils_dir, "*.dat")):
+        with open(path) as f:
+            names = [clean_mpi_name(l) for l in f.read().split("\n") if l.strip()]
+        ret[os.path.basename(path)[:-4]] = sorted(set(names))
+    return dict(sorted(ret.items(), key=lambda x: float(x[0])))
+
+
+def make_prepass(template, names, scale):
+    # Functions of the template keep their record, the others borrow
+    # the record of a template function, then everything is replicated
+    usable = [k for k in sorted(template)
+              if k not in SPECIAL and template[k].get("return_kind") != "NOTHING"]
+    ret = {}
+    for i, name in enumerate(names):
+        if name in template:
+            ret[name] = template[name]
+        else:
+            ret[name] = dict(template[usable[i % len(usable)]], name=name)
+
+    for name in list(ret):
+        if name in SPECIAL or ret[name].get("return_kind") == "NOTHING":
+            continue
+        for k in range(1, scale):
+            copy_name = "{}_x{}".format(name, k)
+            ret[copy_name] = dict(ret[name], name=copy_name)
+    return ret
+
+
+def revision_args(args, rev):
+    # Each revision is generated for its own standard unless --standard
+    # pins them all, so the results compare each standard as generated
+    ret = argparse.Namespace(**vars(args))
+    if ret.mpi_version is None:
+        ret.mpi_version = rev
+    return ret
+
+
+def recorded_args(args):
+    # Everything changing the generated text
+    return {"standard": args.mpi_version,
+            "identity_handles": args.identity_handles,
+            "alias_mode": args.alias_mode,
+            "manglings": args.manglings,
+            "handle_stack_len": args.handle_stack_len,
+            "string_stack_len": args.string_stack_len}
+
+
+def best(callback, repeat):
+    ret = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        callback()
+        elapsed = time.perf_counter() - start
+        ret = elapsed if ret is None else min(ret, elapsed)
+    return ret
+
+
+def peak(callback):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        callback()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_input(path, args):
+    def load():
+        with open(path) as f:
+            return MPI_Interface(f, MPI_Standard_meta(lang="fbind", mpi_version=args.mpi_version))
+
+    iface = load()
+    ret = {"functions": len(iface.functions),
+           "load_s": best(load, args.repeat),
+           "load_peak_bytes": peak(load),
+           "backends": {}}
+
+    for name, make_backend in BACKENDS.items():
+        sink = MPI_Output_sink()
+
+        def run():
+            with open(path) as f:
+                generate(f, [make_backend(args)], [MPI_Output_sink()], jobs=args.jobs)
+
+        with open(path) as f:
+            generate(f, [make_backend(args)], [sink])
+        ret["backends"][name] = {"time_s": best(run, args.repeat),
+                                 "peak_bytes": peak(run),
+                                 "output_bytes": len(sink.getvalue())}
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI generators benchmark suite')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    cfbind.add_arguments(parser)
+    parser.add_argument('--utils', default=os.path.join(BENCH_DIR, "..", "utils"), metavar="DIR", type=str, help='Directory of the per revision function lists (defaults to utils/)')
+    parser.add_argument('--revisions', default=None, metavar="LIST", type=str, help='Comma separated revisions to run (defaults to all)')
+    parser.add_argument('--scales', default="1,4", metavar="LIST", type=str, help='Comma separated replication factors of each revision (defaults to 1,4)')
+    parser.add_argument('--repeat', default=3, metavar="N", type=int, help='Keep the best of N runs (defaults to 3)')
+    # Revisions default to their own standard (see revision_args)
+    parser.set_defaults(mpi_version=None)
+    args = parser.parse_args()
+
+    template = json.load(args.datafile)
+    revisions = load_revisions(args.utils)
+    if args.revisions:
+        revisions = {r: revisions[r] for r in args.revisions.split(",")}
+    scales = [int(s) for s in args.scales.split(",")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rev, names in revisions.items():
+            rev_args = revision_args(args, rev)
+            for scale in scales:
+                path = os.path.join(tmp, "{}x{}.dat".format(rev, scale))
+                with open(path, "w") as f:
+                    json.dump(make_prepass(template, names, scale), f)
+                result = {"revision": rev, "scale": scale, "args": recorded_args(rev_args)}
+                result.update(bench_input(path, rev_args))
+                results.append(result)
+
+    report = {"python": platform.python_version(),
+              "machine": platform.machine(),
+              "template": args.datafile.name,
+              "repeat": args.repeat,
+              "jobs": args.jobs,
+              "results": results}
+    with MPI_Output_sink(args.output or sys.stdout) as out:
+        out.write(json.dumps(report, indent=4) + "\n")
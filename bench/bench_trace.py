@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+import mpitrace
+from mpigen import MPI_Output_sink, add_common_arguments, add_output_argument, generate
+from mpiiface import MPI_Interface, MPI_Standard_meta
+
+STUB_DIR = os.path.join(BENCH_DIR, "trace")
+
+# Wrappers called by trace/bench_trace.c
+FUNCTIONS = ["MPI_Init", "MPI_Finalize", "MPI_Pcontrol", "MPI_Send"]
+
+
+def gen_c_header(functions):
+    ret = ""
+    for f in functions:
+        ret += "{};\n{};\n".format(f.proto(), f.proto(prefix="P"))
+    return ret
+
+
+def gen_pmpi_stubs(functions):
+    # Out of line so the calls are not optimized away
+    ret = "#include <mpi.h>\n\n"
+    for f in functions:
+        ret += "{}\n{{\n\treturn MPI_SUCCESS;\n}}\n\n".format(f.proto(prefix="P"))
+    return ret
+
+
+def build(args, build_dir):
+    b = mpitrace.backend(args)
+    with open(args.datafile.name) as f:
+        iface = MPI_Interface(f, b.meta)
+
+    missing = [name for name in FUNCTIONS if name not in iface.functions]
+    if missing:
+        raise SystemExit("Functions missing from the prepass: {}".format(", ".join(missing)))
+
+    # Only generate the benchmarked wrappers
+    keep = b.filter_callback
+    b.filter_callback = lambda f: keep(f) and f.name() in FUNCTIONS
+    with open(args.datafile.name) as f:
+        generate(f, [b], [os.path.join(build_dir, "mpitrace.c")])
+
+    functions = [iface.functions[name] for name in FUNCTIONS]
+    # The wrappers of the large count (_c) variants call them as well
+    functions += [large for large in [f.large_count_variant(b.large_count) for f in functions] if large]
+    for name, text in (("gen_header.h", gen_c_header(functions)),
+                       ("stubs.c", gen_pmpi_stubs(functions))):
+        with MPI_Output_sink(os.path.join(build_dir, name)) as out:
+            out.write(text)
+
+    binary = os.path.join(build_dir, "bench_trace")
+    cmd = [args.cc] + shlex.split(args.cflags) + [
+        "-I", os.path.join(STUB_DIR, "include"), "-I", build_dir,
+        "-o", binary,
+        os.path.join(STUB_DIR, "bench_trace.c"),
+        os.path.join(STUB_DIR, "stub_mpi.c"),
+        os.path.join(build_dir, "stubs.c"),
+        os.path.join(build_dir, "mpitrace.c"),
+        "-lpthread"]
+    subprocess.run(cmd, check=True)
+    return binary, iface
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tracing library per event overhead benchmark')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    parser.add_argument('--cc', default=os.environ.get("CC", "gcc"), metavar="CC", type=str, help='C compiler (defaults to $CC or gcc)')
+    parser.add_argument('--cflags', default="-O2", metavar="FLAGS", type=str, help='Flags used to build the library and the stub runtime')
+    parser.add_argument('--iterations', default=262144, metavar="N", type=int, help='Calls of each case (rounded up to whole batches)')
+    parser.add_argument('--build-dir', default=None, metavar="DIR", type=str, help='Keep the generated sources, binary and trace in this directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_dir = args.build_dir or tmp
+        os.makedirs(build_dir, exist_ok=True)
+        binary, iface = build(args, build_dir)
+
+        env = dict(os.environ, MPITRACE_OUTPUT=os.path.join(build_dir, "trace"))
+        env.pop("MPITRACE_DISABLE", None)
+        run = subprocess.run([binary, str(args.iterations)], check=True, stdout=subprocess.PIPE,
+                             universal_newlines=True, env=env)
+
+        # Timings only hold if the events were recorded, not dropped
+        trace = mpitrace.read_trace(os.path.join(build_dir, "trace.0.bin"), iface)
+
+    report = {"python": platform.python_version(),
+              "machine": platform.machine(),
+              "cc": args.cc,
+              "cflags": args.cflags,
+              "trace": {"events": len(trace["events"]),
+                        "dropped": sum(trace["dropped"].values())},
+              "results": [json.loads(l) for l in run.stdout.splitlines() if l.strip()]}
+    with MPI_Output_sink(args.output or sys.stdout) as out:
+        out.write(json.dumps(report, indent=4) + "\n")
@@ -0,0 +1,59 @@
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+import cf08bind
+import cfbind
+import mpiheader
+from bench_fbind import STUB_DIR, gen_stub_types
+from mpigen import MPI_Output_sink, add_common_arguments, generate
+from mpiiface import MPI_Interface
+
+
+def build(args, build_dir):
+    header = mpiheader.backend(args)
+    backends = [header, cfbind.backend(args), cf08bind.backend(args)]
+    outputs = [os.path.join(build_dir, name) for name in ("gen_header.h", "fbind.c", "f08bind.c")]
+
+    with open(args.datafile.name) as f:
+        generate(f, backends, outputs)
+
+    # Every function of the header, large count (_c) ones included
+    with open(args.datafile.name) as f:
+        iface = MPI_Interface(f, header.meta)
+    functions = [f for f in iface.sorted_functions() if header.filter_callback(f)]
+    functions += [large for large in [f.large_count_variant(header.large_count) for f in functions] if large]
+
+    with MPI_Output_sink(os.path.join(build_dir, "gen_types.h")) as out:
+        out.write(gen_stub_types(functions))
+
+    return outputs[1:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compile the Fortran bindings against the generated C header')
+    add_common_arguments(parser)
+    cfbind.add_arguments(parser)
+    parser.add_argument('--cc', default=os.environ.get("CC", "gcc"), metavar="CC", type=str, help='C compiler (defaults to $CC or gcc)')
+    parser.add_argument('--cflags', default="-Wall -Werror", metavar="FLAGS", type=str, help='Flags of the check, warnings are errors by default')
+    parser.add_argument('--build-dir', default=None, metavar="DIR", type=str, help='Keep the generated sources in this directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_dir = args.build_dir or tmp
+        os.makedirs(build_dir, exist_ok=True)
+        failed = []
+        for source in build(args, build_dir):
+            cmd = [args.cc, "-fsyntax-only"] + shlex.split(args.cflags) + [
+                "-I", os.path.join(STUB_DIR, "include"), "-I", build_dir, source]
+            if subprocess.run(cmd).returncode:
+                failed.append(os.path.basename(source))
+
+    if failed:
+        raise SystemExit("{} do not compile against the generated header".format(", ".join(failed)))
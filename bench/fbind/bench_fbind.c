@@ -0,0 +1,162 @@
+#include <mpc_mpi.h>
+#include <stdio.h>
+#include <time.h>
+
+/* Generated by bench/bench_fbind.py: wrapper prototypes and the
+ * bench_<function>_<parameter>_t Fortran side parameter types */
+#include "fbind_bench.h"
+
+static double now_ns(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static long iterations(long size)
+{
+	long ret = 4000000 / (size + 8);
+
+	return (ret < 1000) ? 1000 : ret;
+}
+
+static void report(const char *name, long size, long iters, double wrapper, double direct, unsigned long allocs)
+{
+	printf("{\"case\": \"%s\", \"size\": %ld, \"iterations\": %ld, "
+	       "\"wrapper_ns\": %.2f, \"direct_ns\": %.2f, \"overhead_ns\": %.2f, "
+	       "\"allocs_per_call\": %.4f}\n",
+	       name, size, iters, wrapper / iters, direct / iters,
+	       (wrapper - direct) / iters, (double)allocs / iters);
+}
+
+/* Run a wrapper and the C call it forwards to the same number of times */
+#define BENCH(name, size, wrapper_call, direct_call)            \
+	do                                                          \
+	{                                                           \
+		long          iters = iterations(size);                 \
+		long          i;                                        \
+		double        start, wrapper, direct;                   \
+		unsigned long allocs;                                   \
+		wrapper_call; /* warm up the caches */                  \
+		allocs = stub_alloc_count;                              \
+		start  = now_ns();                                      \
+		for(i = 0; i < iters; i++)                              \
+		{                                                       \
+			wrapper_call;                                       \
+		}                                                       \
+		wrapper = now_ns() - start;                             \
+		allocs  = stub_alloc_count - allocs;                    \
+		start   = now_ns();                                     \
+		for(i = 0; i < iters; i++)                              \
+		{                                                       \
+			direct_call;                                        \
+		}                                                       \
+		direct = now_ns() - start;                              \
+		report(name, size, iters, wrapper, direct, allocs);     \
+	} while(0)
+
+static void bench_send(void)
+{
+	char                      buf[8] = {0};
+	bench_MPI_Send_count_t    count    = 8;
+	bench_MPI_Send_datatype_t datatype = 1;
+	bench_MPI_Send_dest_t     dest     = 0;
+	bench_MPI_Send_tag_t      tag      = 0;
+	bench_MPI_Send_comm_t     comm     = 0;
+	int ierror;
+
+	BENCH("send", 1,
+	      mpi_send_(buf, &count, &datatype, &dest, &tag, &comm, &ierror),
+	      MPI_Send(buf, count, datatype, dest, tag, comm));
+}
+
+static void bench_waitall(int count)
+{
+	bench_MPI_Waitall_array_of_requests_t *frequests = calloc(count, sizeof(*frequests));
+	MPI_Request *requests = calloc(count, sizeof(*requests));
+	MPI_Status * statuses = calloc(count, sizeof(*statuses));
+	bench_MPI_Waitall_count_t fcount = count;
+	int ierror;
+
+	BENCH("waitall", count,
+	      mpi_waitall_(&fcount, frequests, statuses, &ierror),
+	      MPI_Waitall(count, requests, statuses));
+
+	free(frequests);
+	free(requests);
+	free(statuses);
+}
+
+static void bench_alltoallw(MPI_Comm comm, int size)
+{
+	bench_MPI_Alltoallw_sendcounts_t *counts = calloc(size, sizeof(*counts));
+	bench_MPI_Alltoallw_sdispls_t *   displs = calloc(size, sizeof(*displs));
+	bench_MPI_Alltoallw_sendtypes_t * ftypes = calloc(size, sizeof(*ftypes));
+	MPI_Datatype *types = calloc(size, sizeof(*types));
+	bench_MPI_Alltoallw_comm_t fcomm = comm;
+	char sendbuf[8], recvbuf[8];
+	int  ierror;
+
+	/* The wrapper caches the length on the communicator */
+	stub_comm_size = size;
+
+	BENCH("alltoallw", size,
+	      mpi_alltoallw_(sendbuf, counts, displs, ftypes, recvbuf, counts, displs, ftypes, &fcomm, &ierror),
+	      MPI_Alltoallw(sendbuf, counts, displs, types, recvbuf, counts, displs, types, comm));
+
+	free(counts);
+	free(displs);
+	free(ftypes);
+	free(types);
+}
+
+static void bench_info_set(int len)
+{
+	/* Blank padded Fortran strings, value is also NUL terminated
+	 * after its len characters for the direct C call */
+	char *key   = malloc(len);
+	char *value = malloc(len + 1);
+	bench_MPI_Info_set_info_t finfo = 0;
+	int ierror;
+
+	memset(key, ' ', len);
+	memset(value, 'v', len);
+	value[len] = '\0';
+	memcpy(key, "bench_key", 9);
+
+	BENCH("info_set", len,
+	      mpi_info_set_(&finfo, key, value, &ierror, len, len),
+	      MPI_Info_set(0, "bench_key", value));
+
+	free(key);
+	free(value);
+}
+
+int main(int argc, char **argv)
+{
+	int waitall_counts[] = { 1, 8, 32, 33, 256, 4096 };
+	int alltoallw_sizes[] = { 4, 32, 64, 1024 };
+	int info_lengths[] = { 32, 255, 1024 };
+	unsigned int i;
+
+	bench_send();
+
+	for(i = 0; i < sizeof(waitall_counts) / sizeof(int); i++)
+	{
+		bench_waitall(waitall_counts[i]);
+	}
+
+	/* One communicator per size as lengths are cached */
+	for(i = 0; i < sizeof(alltoallw_sizes) / sizeof(int); i++)
+	{
+		bench_alltoallw(i + 1, alltoallw_sizes[i]);
+	}
+
+	for(i = 0; i < sizeof(info_lengths) / sizeof(int); i++)
+	{
+		bench_info_set(info_lengths[i]);
+	}
+
+	return 0;
+}
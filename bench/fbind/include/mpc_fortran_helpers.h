@@ -0,0 +1,6 @@
+#ifndef STUB_MPC_FORTRAN_HELPERS_H
+#define STUB_MPC_FORTRAN_HELPERS_H
+
+/* Nothing needed by the stub runtime */
+
+#endif /* STUB_MPC_FORTRAN_HELPERS_H */
@@ -0,0 +1,100 @@
+#ifndef STUB_MPC_MPI_H
+#define STUB_MPC_MPI_H
+
+/* Minimal stand-in for the MPI runtime, just enough to build the
+ * generated Fortran wrappers and measure their own cost */
+
+#include <stddef.h>
+#include <string.h>
+#include <stdlib.h>
+
+typedef int MPI_Fint;
+typedef long MPI_Aint;
+typedef long long MPI_Count;
+typedef long long MPI_Offset;
+
+typedef int MPI_Comm;
+typedef int MPI_Datatype;
+typedef int MPI_Request;
+typedef int MPI_Info;
+typedef int MPI_Op;
+typedef int MPI_Group;
+typedef int MPI_Win;
+typedef int MPI_File;
+typedef int MPI_Errhandler;
+typedef int MPI_Message;
+typedef int MPI_Session;
+
+typedef struct
+{
+	int MPI_SOURCE;
+	int MPI_TAG;
+	int MPI_ERROR;
+	int reserved[3];
+} MPI_Status;
+
+typedef struct
+{
+	MPI_Fint reserved[6];
+} MPI_F08_status;
+
+typedef int MPI_Comm_copy_attr_function(MPI_Comm oldcomm, int comm_keyval, void *extra_state, void *attribute_val_in, void *attribute_val_out, int *flag);
+typedef int MPI_Comm_delete_attr_function(MPI_Comm comm, int comm_keyval, void *attribute_val, void *extra_state);
+
+#define MPI_BOTTOM                 ((void *)0)
+#define MPI_IN_PLACE               ((void *)1)
+#define MPI_SUCCESS                0
+#define MPI_UNDEFINED              (-32766)
+#define MPI_KEYVAL_INVALID         (-1)
+#define MPI_COMM_NULL_COPY_FN      ((MPI_Comm_copy_attr_function *)0)
+#define MPI_CART                   1
+#define MPI_GRAPH                  2
+#define MPI_DIST_GRAPH             3
+
+/* Generated: the other types of the header as opaque integers
+ * then the prototypes of mpiheader.py */
+#include "gen_types.h"
+#include "gen_header.h"
+
+#define STUB_CONV(T, N)                   \
+	T PMPI_ ## N ## _f2c(MPI_Fint handle); \
+	MPI_Fint PMPI_ ## N ## _c2f(T handle);
+
+STUB_CONV(MPI_Comm, Comm)
+STUB_CONV(MPI_Datatype, Type)
+STUB_CONV(MPI_Request, Request)
+STUB_CONV(MPI_Info, Info)
+STUB_CONV(MPI_Op, Op)
+STUB_CONV(MPI_Group, Group)
+STUB_CONV(MPI_Win, Win)
+STUB_CONV(MPI_File, File)
+STUB_CONV(MPI_Errhandler, Errhandler)
+STUB_CONV(MPI_Message, Message)
+STUB_CONV(MPI_Session, Session)
+
+void **mpi_predef_bottom(void);
+void **mpi_predef08_bottom(void);
+void **mpi_predef_inplace(void);
+void **mpi_predef08_inplace(void);
+
+/* Used by the helpers of the generated prelude */
+int PMPI_Comm_create_keyval(MPI_Comm_copy_attr_function *comm_copy_attr_fn, MPI_Comm_delete_attr_function *comm_delete_attr_fn, int *comm_keyval, void *extra_state);
+int PMPI_Comm_free_keyval(int *comm_keyval);
+int PMPI_Initialized(int *flag);
+int PMPI_Comm_get_attr(MPI_Comm comm, int comm_keyval, void *attribute_val, int *flag);
+int PMPI_Comm_set_attr(MPI_Comm comm, int comm_keyval, void *attribute_val);
+int PMPI_Comm_test_inter(MPI_Comm comm, int *flag);
+int PMPI_Comm_remote_size(MPI_Comm comm, int *size);
+int PMPI_Comm_size(MPI_Comm comm, int *size);
+int PMPI_Comm_rank(MPI_Comm comm, int *rank);
+int PMPI_Topo_test(MPI_Comm comm, int *status);
+int PMPI_Cartdim_get(MPI_Comm comm, int *ndims);
+int PMPI_Graph_neighbors_count(MPI_Comm comm, int rank, int *nneighbors);
+int PMPI_Dist_graph_neighbors_count(MPI_Comm comm, int *indegree, int *outdegree, int *weighted);
+
+/* Knobs and counters of the stub runtime */
+extern int stub_comm_size;
+extern unsigned long stub_alloc_count;
+extern unsigned long stub_free_count;
+
+#endif /* STUB_MPC_MPI_H */
@@ -0,0 +1,20 @@
+#ifndef STUB_SCTK_ALLOC_H
+#define STUB_SCTK_ALLOC_H
+
+#include <stddef.h>
+
+/* Counting allocator, see stub_mpi.c */
+void *sctk_malloc(size_t size);
+void *sctk_realloc(void *ptr, size_t size);
+void sctk_free(void *ptr);
+
+#define assume(x)               \
+	do                          \
+	{                           \
+		if(!(x))                \
+		{                       \
+			abort();            \
+		}                       \
+	} while(0)
+
+#endif /* STUB_SCTK_ALLOC_H */
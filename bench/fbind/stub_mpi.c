@@ -0,0 +1,171 @@
+#include <mpc_mpi.h>
+#include <sctk_alloc.h>
+
+/* Runtime side of the stub MPI. Everything is kept out of line so that
+ * the wrappers pay the same calls as against a real runtime. */
+
+int stub_comm_size = 4;
+unsigned long stub_alloc_count = 0;
+unsigned long stub_free_count = 0;
+
+void *sctk_malloc(size_t size)
+{
+	stub_alloc_count++;
+	return malloc(size);
+}
+
+void *sctk_realloc(void *ptr, size_t size)
+{
+	stub_alloc_count++;
+	return realloc(ptr, size);
+}
+
+void sctk_free(void *ptr)
+{
+	stub_free_count++;
+	free(ptr);
+}
+
+/* Handles are the same integers on both sides */
+#define STUB_CONV_IMPL(T, N)                 \
+	T PMPI_ ## N ## _f2c(MPI_Fint handle)    \
+	{                                        \
+		return (T)handle;                    \
+	}                                        \
+	MPI_Fint PMPI_ ## N ## _c2f(T handle)    \
+	{                                        \
+		return (MPI_Fint)handle;             \
+	}
+
+STUB_CONV_IMPL(MPI_Comm, Comm)
+STUB_CONV_IMPL(MPI_Datatype, Type)
+STUB_CONV_IMPL(MPI_Request, Request)
+STUB_CONV_IMPL(MPI_Info, Info)
+STUB_CONV_IMPL(MPI_Op, Op)
+STUB_CONV_IMPL(MPI_Group, Group)
+STUB_CONV_IMPL(MPI_Win, Win)
+STUB_CONV_IMPL(MPI_File, File)
+STUB_CONV_IMPL(MPI_Errhandler, Errhandler)
+STUB_CONV_IMPL(MPI_Message, Message)
+STUB_CONV_IMPL(MPI_Session, Session)
+
+/* Fortran MPI_BOTTOM and MPI_IN_PLACE are distinct addresses */
+static void *__stub_bottom;
+static void *__stub_inplace;
+
+void **mpi_predef_bottom(void)
+{
+	return &__stub_bottom;
+}
+
+void **mpi_predef08_bottom(void)
+{
+	return &__stub_bottom;
+}
+
+void **mpi_predef_inplace(void)
+{
+	return &__stub_inplace;
+}
+
+void **mpi_predef08_inplace(void)
+{
+	return &__stub_inplace;
+}
+
+/* The benchmark runs as if MPI_Init was called from C */
+int PMPI_Initialized(int *flag)
+{
+	*flag = 1;
+	return MPI_SUCCESS;
+}
+
+/* Attributes of a handful of communicators */
+#define STUB_MAX_COMM      16
+#define STUB_MAX_KEYVAL    16
+
+static int __stub_keyval_count = 0;
+static void *__stub_attr[STUB_MAX_COMM][STUB_MAX_KEYVAL];
+static int __stub_attr_set[STUB_MAX_COMM][STUB_MAX_KEYVAL];
+
+int PMPI_Comm_create_keyval(MPI_Comm_copy_attr_function *comm_copy_attr_fn, MPI_Comm_delete_attr_function *comm_delete_attr_fn, int *comm_keyval, void *extra_state)
+{
+	assume(__stub_keyval_count < STUB_MAX_KEYVAL);
+	*comm_keyval = __stub_keyval_count++;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_free_keyval(int *comm_keyval)
+{
+	*comm_keyval = MPI_KEYVAL_INVALID;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_get_attr(MPI_Comm comm, int comm_keyval, void *attribute_val, int *flag)
+{
+	assume(0 <= comm && comm < STUB_MAX_COMM);
+	*flag = __stub_attr_set[comm][comm_keyval];
+	if(*flag)
+	{
+		*(void **)attribute_val = __stub_attr[comm][comm_keyval];
+	}
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_set_attr(MPI_Comm comm, int comm_keyval, void *attribute_val)
+{
+	assume(0 <= comm && comm < STUB_MAX_COMM);
+	__stub_attr[comm][comm_keyval] = attribute_val;
+	__stub_attr_set[comm][comm_keyval] = 1;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_test_inter(MPI_Comm comm, int *flag)
+{
+	*flag = 0;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_remote_size(MPI_Comm comm, int *size)
+{
+	*size = stub_comm_size;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_size(MPI_Comm comm, int *size)
+{
+	*size = stub_comm_size;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Comm_rank(MPI_Comm comm, int *rank)
+{
+	*rank = 0;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Topo_test(MPI_Comm comm, int *status)
+{
+	*status = MPI_UNDEFINED;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Cartdim_get(MPI_Comm comm, int *ndims)
+{
+	*ndims = 0;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Graph_neighbors_count(MPI_Comm comm, int rank, int *nneighbors)
+{
+	*nneighbors = 0;
+	return MPI_SUCCESS;
+}
+
+int PMPI_Dist_graph_neighbors_count(MPI_Comm comm, int *indegree, int *outdegree, int *weighted)
+{
+	*indegree = 0;
+	*outdegree = 0;
+	*weighted = 0;
+	return MPI_SUCCESS;
+}
@@ -0,0 +1,97 @@
+#include <mpi.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+/* Must match the period the generated library was built with */
+#ifndef MPITRACE_FLUSH_US
+	#define MPITRACE_FLUSH_US 1000
+#endif
+
+/* Calls per timed batch, small enough for the default ring to
+ * hold the events of a whole batch */
+#define BENCH_BATCH 8192
+
+static double now_ns(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+/* Untimed, lets the flusher empty the rings so that events are
+ * recorded rather than dropped */
+static void drain(void)
+{
+	struct timespec period = { 0, 4 * MPITRACE_FLUSH_US * 1000L };
+
+	nanosleep(&period, NULL);
+}
+
+static void report(const char *name, long iters, int events, double traced, double direct)
+{
+	printf("{\"case\": \"%s\", \"iterations\": %ld, \"events_per_call\": %d, "
+	       "\"traced_ns\": %.2f, \"direct_ns\": %.2f, \"overhead_ns\": %.2f, ",
+	       name, iters, events, traced / iters, direct / iters, (traced - direct) / iters);
+
+	if(events)
+	{
+		printf("\"ns_per_event\": %.2f}\n", (traced - direct) / iters / events);
+	}
+	else
+	{
+		printf("\"ns_per_event\": null}\n");
+	}
+}
+
+/* Run the traced MPI_X and the PMPI_X it forwards to the same number
+ * of times, in batches separated by a drain of the rings */
+#define BENCH(name, iters, events, traced_call, direct_call)    \
+	do                                                          \
+	{                                                           \
+		long   i, j;                                            \
+		double start, traced = 0, direct = 0;                   \
+		traced_call; /* warm up the caches and the ring */      \
+		for(i = 0; i < iters; i += BENCH_BATCH)                 \
+		{                                                       \
+			drain();                                            \
+			start = now_ns();                                   \
+			for(j = 0; j < BENCH_BATCH; j++)                    \
+			{                                                   \
+				traced_call;                                    \
+			}                                                   \
+			traced += now_ns() - start;                         \
+			start   = now_ns();                                 \
+			for(j = 0; j < BENCH_BATCH; j++)                    \
+			{                                                   \
+				direct_call;                                    \
+			}                                                   \
+			direct += now_ns() - start;                         \
+		}                                                       \
+		report(name, i, events, traced, direct);                \
+	} while(0)
+
+int main(int argc, char **argv)
+{
+	long iters = (argc > 1) ? atol(argv[1]) : 262144;
+	char buf[8] = { 0 };
+
+	MPI_Init(&argc, &argv);
+
+	/* An enter event with count, dest, tag and comm then an exit event */
+	BENCH("send", iters, 2,
+	      MPI_Send(buf, 8, 1, 3, 7, MPI_COMM_WORLD),
+	      PMPI_Send(buf, 8, 1, 3, 7, MPI_COMM_WORLD));
+
+	/* Recording switched off by MPI_Pcontrol */
+	MPI_Pcontrol(0);
+	BENCH("send_disabled", iters, 0,
+	      MPI_Send(buf, 8, 1, 3, 7, MPI_COMM_WORLD),
+	      PMPI_Send(buf, 8, 1, 3, 7, MPI_COMM_WORLD));
+	MPI_Pcontrol(1);
+
+	MPI_Finalize();
+
+	return 0;
+}
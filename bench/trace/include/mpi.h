@@ -0,0 +1,27 @@
+#ifndef STUB_MPI_H
+#define STUB_MPI_H
+
+/* Minimal stand-in for the MPI runtime, just enough to build the
+ * generated tracing library and measure its own cost */
+
+#include <stddef.h>
+
+typedef int MPI_Fint;
+typedef long MPI_Aint;
+typedef long long MPI_Count;
+typedef long long MPI_Offset;
+
+typedef int MPI_Comm;
+typedef int MPI_Datatype;
+
+#define MPI_SUCCESS       0
+#define MPI_COMM_WORLD    ((MPI_Comm)1)
+
+/* MPI_X and PMPI_X prototypes of the benchmarked functions */
+#include "gen_header.h"
+
+/* Used by the prelude of the generated library */
+MPI_Fint PMPI_Comm_c2f(MPI_Comm comm);
+int PMPI_Comm_rank(MPI_Comm comm, int *rank);
+
+#endif /* STUB_MPI_H */
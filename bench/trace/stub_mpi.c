@@ -0,0 +1,15 @@
+#include <mpi.h>
+
+/* Runtime side of the stub MPI, kept out of line so that the
+ * tracing wrappers pay the same calls as against a real runtime */
+
+MPI_Fint PMPI_Comm_c2f(MPI_Comm comm)
+{
+	return (MPI_Fint)comm;
+}
+
+int PMPI_Comm_rank(MPI_Comm comm, int *rank)
+{
+	*rank = 0;
+	return MPI_SUCCESS;
+}
@@ -5,8 +5,6 @@ Defines the binding types for the MPI bindings generation tool.
 
 # flake8: noqa: E302
 
-import copy
-
 
 LIS_KIND_MAP = {
     # Pointers
@@ -537,8 +535,7 @@ BASE_C_KIND_MAP = {
 
 # These 2 maps are meant to be used.  They have types filled in for POLLY*.
 
-SMALL_C_KIND_MAP = copy.deepcopy(BASE_C_KIND_MAP)
-SMALL_C_KIND_MAP.update({
+_SMALL_C_OVERLAY = {
     'POLYDISPLACEMENT'    : 'int',
     'POLYRMA_DISPLACEMENT': 'int',
     'POLYRMA_DISPLACEMENT_NNI'  : 'int',
@@ -557,10 +554,9 @@ SMALL_C_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'MPI_Aint',
     'POLYLOCATION'  : 'MPI_Aint',
     'POLYNUM_PARAM_VALUES': 'int',
-})
+}
 
-BIG_C_KIND_MAP = copy.deepcopy(BASE_C_KIND_MAP)
-BIG_C_KIND_MAP.update({
+_BIG_C_OVERLAY = {
     'POLYDISPLACEMENT'    : 'MPI_Aint',
     'POLYRMA_DISPLACEMENT': 'MPI_Aint',
     'POLYRMA_DISPLACEMENT_NNI'  : 'MPI_Aint',
@@ -579,7 +575,7 @@ BIG_C_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'MPI_Count',
     'POLYLOCATION'  : 'MPI_Count',
     'POLYNUM_PARAM_VALUES': 'MPI_Count',
-})
+}
 
 #------------------------------------
 
@@ -826,8 +822,7 @@ BASE_F90_KIND_MAP = {
 
 # These 2 maps are meant to be used.  They have types filled in for POLY*.
 
-SMALL_F90_KIND_MAP = copy.deepcopy(BASE_F90_KIND_MAP)
-SMALL_F90_KIND_MAP.update({
+_SMALL_F90_OVERLAY = {
     'POLYDISPLACEMENT'      : 'INTEGER',
     'POLYRMA_DISPLACEMENT'  : 'INTEGER',
     'POLYRMA_DISPLACEMENT_NNI': 'INTEGER',
@@ -846,10 +841,9 @@ SMALL_F90_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYLOCATION'          : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYNUM_PARAM_VALUES': 'INTEGER',
-})
+}
 
-BIG_F90_KIND_MAP = copy.deepcopy(BASE_F90_KIND_MAP)
-BIG_F90_KIND_MAP.update({
+_BIG_F90_OVERLAY = {
     'POLYDISPLACEMENT'      : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYRMA_DISPLACEMENT'  : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYRMA_DISPLACEMENT_NNI': 'INTEGER(KIND=MPI_ADDRESS_KIND)',
@@ -868,7 +862,7 @@ BIG_F90_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYLOCATION'          : 'INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYNUM_PARAM_VALUES': 'INTEGER(KIND=MPI_COUNT_KIND)',
-})
+}
 
 #------------------------------------
 
@@ -878,8 +872,7 @@ BIG_F90_KIND_MAP.update({
 # -- it is copied and used as the basis for multiple other kind maps
 # that fill in proper types for the POLLY* types.
 
-BASE_F08_KIND_MAP = copy.deepcopy(BASE_F90_KIND_MAP)
-BASE_F08_KIND_MAP.update({
+_BASE_F08_OVERLAY = {
     'BUFFER'              : 'TYPE(*), DIMENSION(..)',
     'C_BUFFER'            : 'TYPE(C_PTR)',
     'C_BUFFER2'           : 'TYPE(C_PTR)',
@@ -904,13 +897,12 @@ BASE_F08_KIND_MAP.update({
     'STATUS'              : 'TYPE(MPI_Status)',
     'WINDOW'              : 'TYPE(MPI_Win)',
     'OPERATION'           : 'TYPE(MPI_Op)',
-})
+}
 
 
 # These 2 maps are meant to be used.  They have types filled in for POLY*.
 
-SMALL_F08_KIND_MAP = copy.deepcopy(BASE_F08_KIND_MAP)
-SMALL_F08_KIND_MAP.update({
+_SMALL_F08_OVERLAY = {
     'POLYDISPLACEMENT'      : 'INTEGER',
     'POLYRMA_DISPLACEMENT'  : 'INTEGER',
     'POLYRMA_DISPLACEMENT_NNI': 'INTEGER',
@@ -929,10 +921,9 @@ SMALL_F08_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYLOCATION'          : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYNUM_PARAM_VALUES': 'INTEGER',
-})
+}
 
-BIG_F08_KIND_MAP = copy.deepcopy(BASE_F08_KIND_MAP)
-BIG_F08_KIND_MAP.update({
+_BIG_F08_OVERLAY = {
     'POLYDISPLACEMENT'      : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYRMA_DISPLACEMENT'  : 'INTEGER(KIND=MPI_ADDRESS_KIND)',
     'POLYRMA_DISPLACEMENT_NNI': 'INTEGER(KIND=MPI_ADDRESS_KIND)',
@@ -951,10 +942,9 @@ BIG_F08_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYLOCATION'          : 'INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYNUM_PARAM_VALUES': 'INTEGER(KIND=MPI_COUNT_KIND)',
-})
+}
 
-OR_F08_KIND_MAP = copy.deepcopy(BASE_F08_KIND_MAP)
-OR_F08_KIND_MAP.update({
+_OR_F08_OVERLAY = {
     'POLYDISPLACEMENT'    : 'INTEGER \\emph{or} INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYRMA_DISPLACEMENT': 'INTEGER \\emph{or} INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYDISPOFFSET'      : 'INTEGER(KIND=MPI_ADDRESS_KIND \\emph{or} KIND=MPI_COUNT_KIND)',
@@ -972,4 +962,35 @@ OR_F08_KIND_MAP.update({
     'POLYDTYPE_PACK_SIZE'   : 'INTEGER \\emph{or} INTEGER(KIND=MPI_COUNT_KIND)',
     'POLYLOCATION'          : 'INTEGER(KIND=MPI_ADDRESS_KIND \\emph{or} KIND=MPI_COUNT_KIND)',
     'POLYNUM_PARAM_VALUES': 'INTEGER \\emph{or} INTEGER(KIND=MPI_COUNT_KIND)',
-})
+}
+
+#------------------------------------
+
+# The maps derived from a base map are only built when first accessed,
+# a run usually needs a single one of them.
+
+_LAYERS = {
+    'SMALL_C_KIND_MAP': ('BASE_C_KIND_MAP', _SMALL_C_OVERLAY),
+    'BIG_C_KIND_MAP': ('BASE_C_KIND_MAP', _BIG_C_OVERLAY),
+    'SMALL_F90_KIND_MAP': ('BASE_F90_KIND_MAP', _SMALL_F90_OVERLAY),
+    'BIG_F90_KIND_MAP': ('BASE_F90_KIND_MAP', _BIG_F90_OVERLAY),
+    'BASE_F08_KIND_MAP': ('BASE_F90_KIND_MAP', _BASE_F08_OVERLAY),
+    'SMALL_F08_KIND_MAP': ('BASE_F08_KIND_MAP', _SMALL_F08_OVERLAY),
+    'BIG_F08_KIND_MAP': ('BASE_F08_KIND_MAP', _BIG_F08_OVERLAY),
+    'OR_F08_KIND_MAP': ('BASE_F08_KIND_MAP', _OR_F08_OVERLAY),
+}
+
+
+def __getattr__(name):
+    if name not in _LAYERS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    base, overlay = _LAYERS[name]
+    # Values are plain strings, a shallow merge is enough
+    ret = dict(globals()[base] if base in globals() else __getattr__(base))
+    ret.update(overlay)
+    globals()[name] = ret
+    return ret
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAYERS))
@@ -0,0 +1,164 @@
+from mpiiface import MPI_Render_context, MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
+import cfbind
+import argparse
+import sys
+
+# C side of the mpi_f08 module, for each function mpi_<name>_f08 is what
+# the BIND(C) interface of the module calls:
+#  - handles are TYPE(MPI_X) with a single MPI_Fint (MPI_VAL), received by reference
+#  - TYPE(MPI_Status) has the layout of MPI_Status and is forwarded as is
+#  - strings are NUL terminated by the module (no hidden lengths),
+#    output strings are padded on the Fortran side
+#  - buffers are received as plain addresses
+#  - the error code is returned, the module sets ierror when present
+
+PRELUDE = """
+/* TYPE(MPI_Status) is passed to the C functions without copies */
+_Static_assert(sizeof(MPI_F08_status) == sizeof(MPI_Status), "MPI_F08_status and MPI_Status layouts differ");
+
+/* Only the mpi_f08 sentinels can reach these wrappers */
+static inline int buffer_is_bottom08(const void * buffer)
+{
+    struct fortran_sentinels scratch;
+
+    return __builtin_expect(buffer == fortran_sentinels(&scratch)->bottom08, 0);
+}
+
+static inline int buffer_is_mpiinplace08(const void * buffer)
+{
+    struct fortran_sentinels scratch;
+
+    return __builtin_expect(buffer == fortran_sentinels(&scratch)->inplace08, 0);
+}
+
+"""
+
+
+def gen_prelude(cfg, meta):
+    # Handle conversions and scratch storage are shared with the F77 wrappers
+    return cfbind.gen_prelude(cfg, meta) + PRELUDE
+
+
+def is_f08_handle(cfg, p):
+    # TYPE(MPI_X) arguments are the address of their MPI_VAL component
+    ftype = p.meta.f08type(p.kind())
+    return cfg.isconverted(p.kind()) and \
+        ftype is not None and ftype.startswith("TYPE(MPI_")
+
+
+def f08_proto(cfg, f):
+    ctx = MPI_Render_context(types={p.name(): "MPI_Fint" for p in f.parameters if is_f08_handle(cfg, p)})
+
+    if f.isinit():
+        # MPI_Init only takes ierror
+        ctx = ctx.with_skip(2)
+
+    return f.proto(suffix="_f08", lowername=True, ctx=ctx)
+
+
+def parameter_in_conversion(cfg, f):
+    ret = ""
+    rename_list = {}
+    refs = {}
+
+    ret += "/* {} */\n".format(f.meta.fname(f.name()))
+
+    if cfbind.is_alltoallw(f) and not cfg.handle_is_identity("DATATYPE"):
+        comms = f.get_param_by_kind("COMMUNICATOR")
+        if len(comms) == 1:
+            hret, hrename = cfbind.handle_convert_in(cfg, comms[0], f)
+            ret += hret
+            rename_list.update(hrename)
+            ret += "struct fortran_alltoallw_len *alltoallwlen = fortran_alltoallw_len({}, {});\n".format(
+                hrename[comms[0].name()], 1 if "neighbor" in f.name().lower() else 0)
+
+    for p in f.params():
+        if p.kind() == "BUFFER" and p.isin():
+            ret += "if( buffer_is_bottom08({0}) )\n\t{0} = MPI_BOTTOM;\n".format(p.name())
+
+        if p.kind() == "BUFFER" and p.isin() and f.iscollective() and f.number_of_buffer_params() >= 2:
+            ret += "if( buffer_is_mpiinplace08({0}) )\n\t{0} = MPI_IN_PLACE;\n".format(p.name())
+
+        if is_f08_handle(cfg, p):
+            if p.isin():
+                if p.name() not in rename_list:
+                    hret, hrename = cfbind.handle_convert_in(cfg, p, f)
+                    ret += hret
+                    rename_list.update(hrename)
+                refs[p.name()] = "&" if p.type_c_is_pointer() else ""
+            elif p.intent() == "out":
+                hfret, hfrename, hfrefs = cfbind.handle_convert_out_forward_declare(cfg, p, f)
+                ret += hfret
+                rename_list.update(hfrename)
+                refs.update(hfrefs)
+
+    return ret, rename_list, MPI_Render_context(refs=refs)
+
+
+def parameter_out_conversion(cfg, f, rename):
+    ret = ""
+
+    for p in f.params():
+        if is_f08_handle(cfg, p) and p.isout():
+            ret += cfbind.handle_convert_out(cfg, p, f, rename, err="ret") or ""
+
+    return ret
+
+
+def gen_f08_wrapper(cfg, f):
+    out = f08_proto(cfg, f) + "\n"
+    out += "{\n"
+
+    if f.isinit():
+        out += "int *argc = NULL;\n"
+        out += "char ***argv = NULL;\n"
+
+    if f.name() != "MPI_F_sync_reg":
+        ret, rename, ctx = parameter_in_conversion(cfg, f)
+        out += ret + "\n"
+        out += f.gen_call(rename=rename, ctx=ctx) + "\n"
+        if f.isinit():
+            out += "fortran_sentinels_resolve();\n"
+        out += parameter_out_conversion(cfg, f, rename)
+        out += f.gen_return() + "\n"
+
+    out += "}\n"
+
+    return out
+
+
+def gen_f08_iface(cfg, f):
+    # MPI_Sizeof is a generic procedure of the module
+    if f.name() == "MPI_Sizeof":
+        return None
+
+    return gen_f08_wrapper(cfg, f)
+
+
+def is_part_of_bindings(f):
+    return f.isbindings() and \
+        f.isf08() and \
+        not f.iscallback() and \
+        not f.isf08conv() and \
+        not f.isvariadic()
+
+
+def backend(opts):
+    cfg = cfbind.MPI_Fortran_config(opts, lang="f08bind")
+    meta = MPI_Standard_meta(lang="f08bind", fprefix="", mpi_version=opts.mpi_version, bigcount=False)
+    return MPI_Backend("f08bind", meta, is_part_of_bindings, lambda f: gen_f08_iface(cfg, f),
+                       prelude=gen_prelude(cfg, meta),
+                       options={"identity_handles": cfg.identity_handles(),
+                                "large_count": cfg.large_count_meta is not None},
+                       large_count=cfg.large_count_meta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI Fortran 2008 Bindings Generation tool')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    cfbind.add_arguments(parser)
+    args = parser.parse_args()
+
+    generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
@@ -1,47 +1,79 @@
-from mpiiface import MPI_Interface, MPI_Standard_meta
-
-with open("./prepass.dat", "r") as f:
-	a = MPI_Interface(f, MPI_Standard_meta(lang="fbind", fprefix=""))
-
-# First Print Conversion Functions
-print("""
+from mpiiface import MPI_Render_context, MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
+import argparse
+import sys
+
+
+def add_arguments(parser):
+    parser.add_argument('--identity-handles', default="", dest="identity_handles", metavar="KINDS", type=str, help='Comma separated handle kinds (or "all") whose C handle is bit-identical to MPI_Fint')
+    parser.add_argument('--alias-mode', default="forward", dest="alias_mode", choices=["forward", "alias", "weak"], help='How additional Fortran manglings reach the main wrapper: forwarding call, alias attribute or weak symbol (defaults to forward)')
+    parser.add_argument('--manglings', default="double", dest="manglings", metavar="LIST", type=str, help='Comma separated additional manglings among double (mpi_send__), upper (MPI_SEND) and lower (mpi_send), defaults to double')
+    parser.add_argument('--handle-stack-len', default=32, dest="handle_stack_len", metavar="COUNT", type=int, help='Handle arrays up to this length are converted on the stack (defaults to 32)')
+    parser.add_argument('--string-stack-len', default=256, dest="string_stack_len", metavar="SIZE", type=int, help='Trimmed Fortran strings shorter than this are converted on the stack (defaults to 256)')
+
+# Symbol suffix and case of each additional Fortran name mangling
+fortran_manglings = {"double": ("__", False),
+                     "upper": ("", True),
+                     "lower": ("", False)}
+
+# Maximum number of handle arrays converted by a single wrapper
+# each of them gets its own slot in the thread-local scratch pool
+HANDLE_SCRATCH_SLOTS = 4
+
+def gen_prelude(cfg, meta):
+    # First Print Conversion Functions
+    ret = """
 #include <mpc_mpi.h>
 #include <sctk_alloc.h>
+#include <pthread.h>
+#include <string.h>
 
 #include "mpc_fortran_helpers.h"
 
-static inline char * char_fortran_to_c(char *buf, int size, char **free_ptr)
+#ifndef FORTRAN_HANDLE_STACK_LEN
+        #define FORTRAN_HANDLE_STACK_LEN %d
+#endif
+
+#ifndef FORTRAN_STRING_STACK_LEN
+        #define FORTRAN_STRING_STACK_LEN %d
+#endif
+
+/* stack_buf is FORTRAN_STRING_STACK_LEN long, *free_ptr is NULL when it was used */
+static inline char * char_fortran_to_c(char *buf, int size, char *stack_buf, char **free_ptr)
 {
         char *   tmp;
-        long int i;
+        long int begin = 0;
+        long int end   = size;
 
-        tmp = sctk_malloc(size + 1);
-        assume(tmp != NULL);
-        *free_ptr = tmp;
+        /* Trim from both ends without copying the blanks */
 
-        for(i = 0; i < size; i++)
+        while( (begin < end) && (buf[begin] == ' ') )
         {
-                tmp[i] = buf[i];
+                begin++;
         }
-        tmp[i] = '\\0';
 
-        /* Trim */
-
-        while(*tmp == ' ')
+        while( (begin < end) && (buf[end - 1] == ' ') )
         {
-                tmp++;
+                end--;
         }
 
-        size_t len = strlen(tmp);
-
-        char *begin = tmp;
+        size_t len = end - begin;
 
-        while( (tmp[len - 1] == ' ') && (&tmp[len] != begin) )
+        if(len < FORTRAN_STRING_STACK_LEN)
+        {
+                tmp       = stack_buf;
+                *free_ptr = NULL;
+        }
+        else
         {
-                tmp[len - 1] = '\\0';
-                len--;
+                tmp = sctk_malloc(len + 1);
+                assume(tmp != NULL);
+                *free_ptr = tmp;
         }
 
+        memcpy(tmp, buf + begin, len);
+        tmp[len] = '\\0';
+
         return tmp;
 }
 
@@ -55,30 +87,316 @@ static inline void char_c_to_fortran(char *buf, int size)
         }
 }
 
+#define FORTRAN_SCRATCH_SLOTS %d
+
+struct fortran_scratch
+{
+        void * buff;
+        size_t size;
+        int    busy;
+};
+
+/* Allocated on first use, freed by the key destructor when the thread exits */
+static __thread struct fortran_scratch *__fortran_scratch_pool = NULL;
+static pthread_key_t  __fortran_scratch_key;
+static pthread_once_t __fortran_scratch_once = PTHREAD_ONCE_INIT;
+
+static void fortran_scratch_release(void *pool)
+{
+        struct fortran_scratch *scratch = pool;
+        int i;
+
+        for(i = 0; i < FORTRAN_SCRATCH_SLOTS; i++)
+        {
+                if(scratch[i].buff)
+                {
+                        sctk_free(scratch[i].buff);
+                }
+        }
+
+        sctk_free(scratch);
+        __fortran_scratch_pool = NULL;
+}
+
+static void fortran_scratch_key_create(void)
+{
+        pthread_key_create(&__fortran_scratch_key, fortran_scratch_release);
+}
+
+static inline struct fortran_scratch * fortran_scratch_pool(void)
+{
+        if(!__fortran_scratch_pool)
+        {
+                pthread_once(&__fortran_scratch_once, fortran_scratch_key_create);
+                __fortran_scratch_pool = sctk_malloc(sizeof(struct fortran_scratch) * FORTRAN_SCRATCH_SLOTS);
+                assume(__fortran_scratch_pool != NULL);
+                memset(__fortran_scratch_pool, 0, sizeof(struct fortran_scratch) * FORTRAN_SCRATCH_SLOTS);
+                pthread_setspecific(__fortran_scratch_key, __fortran_scratch_pool);
+        }
+
+        return __fortran_scratch_pool;
+}
+
+/* Grow-only per-thread storage for handle arrays which do not fit on the stack,
+ * given back with fortran_scratch_put(). A slot still held by a caller (a
+ * Fortran MPI call from an error handler or a callback) is not shared, the
+ * reentrant call gets its own allocation instead */
+static inline void * fortran_scratch_get(int slot, size_t size)
+{
+        struct fortran_scratch *scratch = &fortran_scratch_pool()[slot];
+
+        if(scratch->busy)
+        {
+                void *buff = sctk_malloc(size);
+
+                assume(buff != NULL);
+                return buff;
+        }
+
+        scratch->busy = 1;
+
+        if(scratch->size < size)
+        {
+                /* Content does not need to be preserved */
+                if(scratch->buff)
+                {
+                        sctk_free(scratch->buff);
+                }
+
+                scratch->buff = sctk_malloc(size);
+                assume(scratch->buff != NULL);
+                scratch->size = size;
+        }
+
+        return scratch->buff;
+}
+
+static inline void fortran_scratch_put(int slot, void *buff)
+{
+        struct fortran_scratch *scratch = &__fortran_scratch_pool[slot];
+
+        if(buff == scratch->buff)
+        {
+                scratch->busy = 0;
+        }
+        else
+        {
+                sctk_free(buff);
+        }
+}
+
+struct fortran_alltoallw_len
+{
+        int sendlen;
+        int recvlen;
+};
+
+/* Communicator keyvals caching the alltoallw and neighbor_alltoallw lengths */
+static int __fortran_alltoallw_keyval[2] = {MPI_KEYVAL_INVALID, MPI_KEYVAL_INVALID};
+
+static int fortran_alltoallw_len_delete(MPI_Comm comm, int keyval, void *attr, void *extra_state)
+{
+        sctk_free(attr);
+        return MPI_SUCCESS;
+}
+
+static inline void fortran_alltoallw_len_compute(MPI_Comm comm, int neighbor, struct fortran_alltoallw_len *len)
+{
+        int size = 0;
+
+        len->sendlen = 0;
+        len->recvlen = 0;
+
+        if(!neighbor)
+        {
+                int inter = 0;
+
+                PMPI_Comm_test_inter(comm, &inter);
+
+                if(inter)
+                {
+                        PMPI_Comm_remote_size(comm, &size);
+                }
+                else
+                {
+                        PMPI_Comm_size(comm, &size);
+                }
+
+                len->sendlen = size;
+                len->recvlen = size;
+                return;
+        }
+
+        int topo = MPI_UNDEFINED;
+
+        PMPI_Topo_test(comm, &topo);
+
+        if(topo == MPI_CART)
+        {
+                PMPI_Cartdim_get(comm, &size);
+                len->sendlen = 2 * size;
+                len->recvlen = 2 * size;
+        }
+        else if(topo == MPI_GRAPH)
+        {
+                int rank = 0;
+
+                PMPI_Comm_rank(comm, &rank);
+                PMPI_Graph_neighbors_count(comm, rank, &size);
+                len->sendlen = size;
+                len->recvlen = size;
+        }
+        else if(topo == MPI_DIST_GRAPH)
+        {
+                int weighted = 0;
+
+                PMPI_Dist_graph_neighbors_count(comm, &len->recvlen, &len->sendlen, &weighted);
+        }
+}
+
+/* Created on first use, a thread losing the race frees its own keyval */
+static inline int fortran_alltoallw_keyval(int neighbor)
+{
+        int keyval   = __atomic_load_n(&__fortran_alltoallw_keyval[neighbor], __ATOMIC_ACQUIRE);
+        int expected = MPI_KEYVAL_INVALID;
+
+        if(__builtin_expect(keyval != MPI_KEYVAL_INVALID, 1) )
+        {
+                return keyval;
+        }
+
+        PMPI_Comm_create_keyval(MPI_COMM_NULL_COPY_FN, fortran_alltoallw_len_delete, &keyval, NULL);
+
+        if(!__atomic_compare_exchange_n(&__fortran_alltoallw_keyval[neighbor], &expected, keyval, 0,
+                                        __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+        {
+                PMPI_Comm_free_keyval(&keyval);
+                keyval = expected;
+        }
+
+        return keyval;
+}
+
+static inline struct fortran_alltoallw_len * fortran_alltoallw_len(MPI_Comm comm, int neighbor)
+{
+        struct fortran_alltoallw_len *len = NULL;
+        int keyval = fortran_alltoallw_keyval(neighbor);
+        int flag   = 0;
+
+        PMPI_Comm_get_attr(comm, keyval, &len, &flag);
+
+        if(!flag)
+        {
+                len = sctk_malloc(sizeof(struct fortran_alltoallw_len) );
+                assume(len != NULL);
+                fortran_alltoallw_len_compute(comm, neighbor, len);
+                PMPI_Comm_set_attr(comm, keyval, len);
+        }
+
+        return len;
+}
+
 #if defined(USE_CHAR_MIXED)
         #define CHAR_END(thename)
         #define CHAR_MIXED(thename) long int thename,
+        #define CHAR_END_ARG(thename)
+        #define CHAR_MIXED_ARG(thename) thename,
 #else
         #define CHAR_END(thename) ,long int thename
         #define CHAR_MIXED(thename)
+        #define CHAR_END_ARG(thename) ,thename
+        #define CHAR_MIXED_ARG(thename)
 #endif
 
 
+/* Fortran MPI_BOTTOM and MPI_IN_PLACE of both interfaces */
+struct fortran_sentinels
+{
+        void *bottom;
+        void *bottom08;
+        void *inplace;
+        void *inplace08;
+};
+
+#define FORTRAN_SENTINELS_UNSET     0
+#define FORTRAN_SENTINELS_RESOLVING 1
+#define FORTRAN_SENTINELS_READY     2
+
+static struct fortran_sentinels __fortran_sentinels;
+static int __fortran_sentinels_state = FORTRAN_SENTINELS_UNSET;
+
+static inline void fortran_sentinels_read(struct fortran_sentinels *sentinels)
+{
+        sentinels->bottom    = *mpi_predef_bottom();
+        sentinels->bottom08  = *mpi_predef08_bottom();
+        sentinels->inplace   = *mpi_predef_inplace();
+        sentinels->inplace08 = *mpi_predef08_inplace();
+}
+
+/* The runtime registers the addresses during MPI_Init, they are only
+ * cached afterwards and published by the single thread winning the CAS */
+static void fortran_sentinels_resolve(void)
+{
+        int initialized = 0;
+        int expected    = FORTRAN_SENTINELS_UNSET;
+
+        PMPI_Initialized(&initialized);
+
+        if(!initialized)
+        {
+                return;
+        }
+
+        if(__atomic_compare_exchange_n(&__fortran_sentinels_state, &expected, FORTRAN_SENTINELS_RESOLVING, 0,
+                                       __ATOMIC_ACQUIRE, __ATOMIC_RELAXED) )
+        {
+                fortran_sentinels_read(&__fortran_sentinels);
+                __atomic_store_n(&__fortran_sentinels_state, FORTRAN_SENTINELS_READY, __ATOMIC_RELEASE);
+        }
+}
+
+/* scratch receives the current addresses while they are not published */
+static inline struct fortran_sentinels * fortran_sentinels(struct fortran_sentinels *scratch)
+{
+        if(__builtin_expect(__atomic_load_n(&__fortran_sentinels_state, __ATOMIC_ACQUIRE) == FORTRAN_SENTINELS_READY, 1) )
+        {
+                return &__fortran_sentinels;
+        }
+
+        /* MPI_Init was not called through the Fortran wrappers */
+        fortran_sentinels_resolve();
+        fortran_sentinels_read(scratch);
+        return scratch;
+}
+
 static inline int buffer_is_bottom(void * buffer)
 {
-    return( (buffer == *mpi_predef_bottom()) ||
-            (buffer == *mpi_predef08_bottom()) );
+    struct fortran_sentinels scratch;
+    struct fortran_sentinels *sentinels = fortran_sentinels(&scratch);
+
+    return __builtin_expect( (buffer == sentinels->bottom) ||
+                             (buffer == sentinels->bottom08), 0);
 }
 
 static inline int buffer_is_mpiinplace(void * buffer)
 {
-    return( (buffer == *mpi_predef_inplace()) ||
-            (buffer == *mpi_predef08_inplace()) );
+    struct fortran_sentinels scratch;
+    struct fortran_sentinels *sentinels = fortran_sentinels(&scratch);
+
+    return __builtin_expect( (buffer == sentinels->inplace) ||
+                             (buffer == sentinels->inplace08), 0);
 }
 
-""")
+""" % (cfg.handle_stack_len, cfg.string_stack_len, HANDLE_SCRATCH_SLOTS)
+    ret += "\n"
+
+    for kind in cfg.identity_handles():
+        ret += "_Static_assert(sizeof({0}) == sizeof(MPI_Fint), \"{0} is not identical to MPI_Fint\");\n".format(meta.kind_expand(kind))
 
-handle_converter = {"COMMUNICATOR": "PMPI_Comm_f2c",
+    return ret
+
+
+default_handle_converter = {"COMMUNICATOR": "PMPI_Comm_f2c",
                     "INFO": "PMPI_Info_f2c",
                     "REQUEST": "PMPI_Request_f2c",
                     "OPERATION": "PMPI_Op_f2c",
@@ -89,17 +407,98 @@ handle_converter = {"COMMUNICATOR": "PMPI_Comm_f2c",
                     "COMMUNICATOR": "PMPI_Comm_f2c",
                     "DATATYPE": "PMPI_Type_f2c"}
 
+class MPI_Fortran_config():
+    """Options of a set of Fortran bindings, passed to the helpers so
+    that differently configured backends can share a generation pass"""
 
-def get_conv_f2c(kind):
-    return handle_converter[kind]
+    def __init__(self, opts, lang="fbind"):
+        self.handle_stack_len = opts.handle_stack_len
+        self.string_stack_len = opts.string_stack_len
+        self.alias_mode = opts.alias_mode
+
+        self.manglings = [x.strip() for x in opts.manglings.split(",") if x.strip()]
+
+        for m in self.manglings:
+            if m not in fortran_manglings:
+                raise Exception("No such Fortran mangling {}".format(m))
+
+        # Handle kinds for which the runtime declares MPI_Fint and the C handle
+        # to be the same, they are then cast instead of being converted
+        self.handle_converter = dict(default_handle_converter)
+
+        if opts.identity_handles == "all":
+            identity_handles = list(self.handle_converter.keys())
+        else:
+            identity_handles = [x.strip() for x in opts.identity_handles.split(",") if x.strip()]
+
+        for kind in identity_handles:
+            if kind not in self.handle_converter:
+                raise Exception("No such handle kind {}".format(kind))
+            self.handle_converter[kind] = None
+
+        # Meta of the MPI 4 large count (_c) wrappers, None before MPI 4
+        self.large_count_meta = MPI_Standard_meta(lang=lang, mpi_version=opts.mpi_version, bigcount=False).large_count()
+
+    def isconverted(self, kind):
+        return kind in self.handle_converter
+
+    def get_conv_f2c(self, kind):
+        return self.handle_converter[kind]
+
+    def get_conv_c2f(self, kind):
+        conv = self.handle_converter[kind]
+        if not conv:
+            return None
+        return conv.replace("f2c", "c2f")
+
+    def handle_is_identity(self, kind):
+        return self.handle_converter[kind] is None
+
+    def identity_handles(self):
+        return sorted([k for k in self.handle_converter if self.handle_is_identity(k)])
 
-def get_conv_c2f(kind):
-    conv = handle_converter[kind]
-    if not conv:
-        return None
-    return conv.replace("f2c", "c2f")
 
-def handle_convert_in_array(p, f):
+# Completion calls only modify the requests they complete, these are
+# reported either through a single index or an array of indices with
+# its length
+completion_outputs = {"MPI_Testany": ("index", None),
+                      "MPI_Waitany": ("index", None),
+                      "MPI_Testsome": ("array_of_indices", "outcount"),
+                      "MPI_Waitsome": ("array_of_indices", "outcount")}
+
+
+def is_alltoallw(f):
+    return f.name().lower().find("alltoallw") != -1
+
+
+def handle_scratch_slot(cfg, p, f):
+    # Each converted handle array of a wrapper uses its own scratch slot
+    arrays = [x.name() for x in f.parameters if cfg.isconverted(x.kind()) and x.length()
+              and not cfg.handle_is_identity(x.kind())]
+    slot = arrays.index(p.name())
+    if slot >= HANDLE_SCRATCH_SLOTS:
+        raise Exception("{} converts more than {} handle arrays".format(f.name(), HANDLE_SCRATCH_SLOTS))
+    return slot
+
+def uses_handle_scratch(cfg, p, rename):
+    # Converted through handle_array_declare() and not used in place
+    return p.name() in rename and p.ishandle() and p.kind() != "STATUS" and \
+        cfg.isconverted(p.kind()) and p.length() and not cfg.handle_is_identity(p.kind())
+
+def handle_array_declare(cfg, p, f, length):
+    if cfg.handle_is_identity(p.kind()):
+        # Fortran array can be used in place
+        return "{1} *c_{0} = ({1} *){0};\n".format(p.name(), p.type_c(noconst=True))
+
+    # Small arrays live on the stack, larger ones in the thread-local pool
+    return """{1} stack_c_{0}[FORTRAN_HANDLE_STACK_LEN];
+{1} *c_{0} = stack_c_{0};
+
+if(FORTRAN_HANDLE_STACK_LEN < {2})
+        c_{0} = ({1}*) fortran_scratch_get({3}, sizeof({1}) * {2});
+""".format(p.name(), p.type_c(noconst=True), length, handle_scratch_slot(cfg, p, f))
+
+def handle_convert_in_array(cfg, p, f):
         ret = ""
         rename_list = {}
 
@@ -109,18 +508,20 @@ def handle_convert_in_array(p, f):
         if p.array_length():
                 ret += "ERRROR " + name
 
-        if f.name().lower().find("alltoallw") != -1:
-            length = "alltoallwlen"
+        if is_alltoallw(f):
+            length = "alltoallwlen->sendlen" if name.startswith("send") else "alltoallwlen->recvlen"
+
+        if cfg.handle_is_identity(p.kind()):
+            ret += handle_array_declare(cfg, p, f, length)
+            rename_list[name] = "c_{0}".format(name)
+            return ret, rename_list
 
         ret += """
 int incnt_{0} = 0;
-{1} *c_{0} = NULL;
-
-c_{0} = ({1}*) sctk_malloc(sizeof({1}) * {2});
-
+{1}
 for(incnt_{0} = 0; incnt_{0} < {2} ; incnt_{0}++)
         c_{0}[incnt_{0}] = {3}({0}[incnt_{0}]);
-        """.format(name, p.type_c(noconst=True), length, get_conv_f2c(p.kind()) )
+        """.format(name, handle_array_declare(cfg, p, f, length), length, cfg.get_conv_f2c(p.kind()) )
 
         rename_list[name] = "c_{0}".format(name)
 
@@ -128,23 +529,27 @@ for(incnt_{0} = 0; incnt_{0} < {2} ; incnt_{0}++)
 
 
 
-def handle_convert_in(p, f):
+def handle_convert_in(cfg, p, f):
     ret = ""
     rename_list = {}
 
-    if p.kind() in handle_converter:
+    if cfg.isconverted(p.kind()):
         if p.length():
-                return handle_convert_in_array(p, f)
+                return handle_convert_in_array(cfg, p, f)
 
-        ret += "{0} c_{1} = {2}(*{1});\n".format(p.type_c(noconst=True),
-                                                 p.name(), get_conv_f2c(p.kind()) )
+        if cfg.handle_is_identity(p.kind()):
+            ret += "{0} c_{1} = ({0})*{1};\n".format(p.type_c(noconst=True), p.name())
+        else:
+            ret += "{0} c_{1} = {2}(*{1});\n".format(p.type_c(noconst=True),
+                                                     p.name(), cfg.get_conv_f2c(p.kind()) )
         rename_list[p.name()] = "c_{}".format(p.name())
     return ret, rename_list
 
 
-def handle_convert_out_forward_declare(p, f):
+def handle_convert_out_forward_declare(cfg, p, f):
     ret = ""
     rename_list = {}
+    refs = {}
 
     did_process = 0
 
@@ -152,7 +557,7 @@ def handle_convert_out_forward_declare(p, f):
         # OUTTYPE has a length
         if(p.length() != "*" and p.array_length() == False):
             # Only in mpi_type_get_contents
-            ret += "{0} * c_{1} = ({0}*)sctk_malloc(sizeof({0}) * *{2});\n".format(p.type_c(noconst=True), p.name(), p.length())
+            ret += handle_array_declare(cfg, p, f, "*" + p.length())
             did_process = 1
         else:
             #OUTTYPE HAS NO LEN (dynamic in call)
@@ -160,7 +565,7 @@ def handle_convert_out_forward_declare(p, f):
     else:
         # Outype has no length
         # Output types are references
-        p.setfbindgetref()
+        refs[p.name()] = "&"
         ret += "{0} c_{1};\n".format(p.type_c(noconst=True), p.name())
         did_process = 1
 
@@ -169,9 +574,38 @@ def handle_convert_out_forward_declare(p, f):
     else:
         ret += "/* OUT ARRAY {} not manipulated */\n".format(p.name())
 
-    return ret, rename_list
+    return ret, rename_list, refs
+
+def handle_convert_out_completed(cfg, p, f, cname, err="*ierror"):
+    # Only write back the entries reported as completed
+    indices, count = completion_outputs[f.name()]
 
-def handle_convert_out(p, f, rename_list):
+    if count:
+        completed = """if( *{1} != MPI_UNDEFINED )
+{{
+        for(outcnt_{0} = 0; outcnt_{0} < *{1} ; outcnt_{0}++)
+                {0}[{2}[outcnt_{0}]] = {4}({3}[{2}[outcnt_{0}]]);
+}}""".format(p.name(), count, indices, cname, cfg.get_conv_c2f(p.kind()))
+    else:
+        completed = """if( *{1} != MPI_UNDEFINED )
+{{
+        {0}[*{1}] = {3}({2}[*{1}]);
+}}""".format(p.name(), indices, cname, cfg.get_conv_c2f(p.kind()))
+
+    return """
+int outcnt_{0} = 0;
+
+if( {5} != MPI_SUCCESS )
+{{
+        /* Completed entries are not known, convert all of them */
+        for(outcnt_{0} = 0; outcnt_{0} < *{2} ; outcnt_{0}++)
+                {0}[outcnt_{0}] = {3}({1}[outcnt_{0}]);
+}}
+else {4}
+
+""".format(p.name(), cname, p.length(), cfg.get_conv_c2f(p.kind()), completed, err)
+
+def handle_convert_out(cfg, p, f, rename_list, err="*ierror"):
     ret = ""
 
     name = p.name()
@@ -185,7 +619,12 @@ def handle_convert_out(p, f, rename_list):
     if(p.length()):
         # OUTTYPE has a length
         if(p.length() != "*"):
-            if p.array_length() == False:
+            if cfg.handle_is_identity(p.kind()):
+                # Array was used in place
+                pass
+            elif p.array_length() == False and f.name() in completion_outputs:
+               ret += handle_convert_out_completed(cfg, p, f, name, err)
+            elif p.array_length() == False:
                # Lenght is determined and a pointer
                length = "*" + p.length()
                ret += """
@@ -194,7 +633,7 @@ int outcnt_{0} = 0;
 for(outcnt_{0} = 0; outcnt_{0} < {2} ; outcnt_{0}++)
         {0}[outcnt_{0}] = {3}({1}[outcnt_{0}]);
 
-""".format(p.name(), name, length, get_conv_c2f(p.kind()) )
+""".format(p.name(), name, length, cfg.get_conv_c2f(p.kind()) )
             else:
                 ret += "/* ERROR array len for {} */\n".format(p.name())
             # Only in mpi_type_get_contents
@@ -205,26 +644,34 @@ for(outcnt_{0} = 0; outcnt_{0} < {2} ; outcnt_{0}++)
     else:
         # Outype has no length
         # Output types are references
-        ret += "*{0} = {1}({2});\n".format(p.name(), get_conv_c2f( p.kind() ), name)
+        if cfg.handle_is_identity(p.kind()):
+            ret += "*{0} = (MPI_Fint){1};\n".format(p.name(), name)
+        else:
+            ret += "*{0} = {1}({2});\n".format(p.name(), cfg.get_conv_c2f( p.kind() ), name)
 
     return ret
 
 
-def parameter_in_conversion(f):
+def parameter_in_conversion(cfg, f):
     ret = ""
     rename_list = {}
+    # How converted parameters are passed to the C call
+    refs = {}
 
 
 
-    # In the alltoallw family length is comm_size
-    # so we need a special handing for it
-    print("/* {} */".format(f.name()))
-    if f.name().lower().find("alltoallw") != -1:
+    # In the alltoallw family length is the (remote) comm size
+    # or the neighbor degrees so we need a special handing for it
+    ret += "/* {} */\n".format(f.meta.fname(f.name()))
+    if is_alltoallw(f) and not cfg.handle_is_identity("DATATYPE"):
             comms = f.get_param_by_kind("COMMUNICATOR")
             if len(comms) == 1:
-                    # We have a single comm
-                    ret += "int alltoallwlen = 0;\n"
-                    ret += "PMPI_Comm_size({}, &alltoallwlen);\n".format(comms[0].name())
+                    # We have a single comm, convert it first
+                    hret, hrename = handle_convert_in(cfg, comms[0], f)
+                    ret += hret
+                    rename_list.update(hrename)
+                    ret += "struct fortran_alltoallw_len *alltoallwlen = fortran_alltoallw_len({}, {});\n".format(
+                        hrename[comms[0].name()], 1 if "neighbor" in f.name().lower() else 0)
 
 
 
@@ -235,9 +682,10 @@ def parameter_in_conversion(f):
         if p.kind() == "STRING" and p.isin():
             # Convert from fortran
             name = p.name()
+            ret += "char stack_{0}[FORTRAN_STRING_STACK_LEN];\n".format(name)
             ret += "char *tmp_{0} = NULL, *ptr_{0} = NULL;\n".format(name)
             rename_list[p.name()] = "tmp_{}".format(name)
-            ret += "tmp_{0} = char_fortran_to_c((char *){0}, size_{0}, &ptr_{0});\n".format(
+            ret += "tmp_{0} = char_fortran_to_c((char *){0}, size_{0}, stack_{0}, &ptr_{0});\n".format(
                 name)
         #
         # Buffer conversion to MPI_BOTTOM
@@ -258,24 +706,24 @@ def parameter_in_conversion(f):
             if p.kind() == "STATUS":
                 pass  # Statusses are ignored as forwarded to Fortran as struct
             elif p.isin():
-                hret, hrename = handle_convert_in(p, f)
-                ret += hret
-                rename_list.update(hrename)
-                p.setfbindnoderef()
+                if p.name() not in rename_list:
+                    hret, hrename = handle_convert_in(cfg, p, f)
+                    ret += hret
+                    rename_list.update(hrename)
                 # If param is a pointer we need to pass the local conversion
                 # by reference to the C function
-                if p.type_c_is_pointer():
-                    p.setfbindgetref()
+                refs[p.name()] = "&" if p.type_c_is_pointer() else ""
             elif p.intent() == "out":#Make sure not to duplicate inout
-                hfret, hfrename = handle_convert_out_forward_declare(p, f)
+                hfret, hfrename, hfrefs = handle_convert_out_forward_declare(cfg, p, f)
                 ret += hfret
                 rename_list.update(hfrename)
+                refs.update(hfrefs)
 
-    return ret, rename_list
+    return ret, rename_list, MPI_Render_context(refs=refs)
 
 
 
-def parameter_out_conversion(f, rename):
+def parameter_out_conversion(cfg, f, rename):
     ret = ""
 
     for p in f.parameters:
@@ -285,71 +733,110 @@ def parameter_out_conversion(f, rename):
         if p.kind() == "STRING" and p.isout():
             ret += "char_c_to_fortran({0},size_{1});\n".format(name, p.name())
         if p.ishandle() and p.kind() != "STATUS" and p.isout():
-            ret += handle_convert_out(p, f, rename)
+            ret += handle_convert_out(cfg, p, f, rename)
 
     # Ensure freing is done last
     for p in f.parameters:
         if p.kind() == "STRING" and p.isin():
-            ret += "sctk_free(ptr_{0});\n".format(p.name())
-        if p.kind() in handle_converter and p.length() and p.name() in rename:
-            ret += "sctk_free({0});\n".format(rename[p.name()])
+            ret += "if(ptr_{0})\n\tsctk_free(ptr_{0});\n".format(p.name())
+        if uses_handle_scratch(cfg, p, rename):
+            ret += "if(c_{0} != stack_c_{0})\n\tfortran_scratch_put({1}, c_{0});\n".format(
+                p.name(), handle_scratch_slot(cfg, p, f))
 
 
     return ret
 
 
-def gen_fortran_iface(f):
+def fortran_proto(f, suffix="_", uppername=False):
+    #
+    # Handle conversion all MPI Handles are Fint
+    #
+    ctx = MPI_Render_context(types={p.name(): "MPI_Fint" for p in f.parameters
+                                    if p.ishandle() and not p.kind() == "STATUS"})
+
+    if f.isinit():
+        # In Fortran MPI Init only takes ierror
+        ctx = ctx.with_skip(2)
+
+    return f.proto(suffix=suffix, lowername=not uppername, uppername=uppername, ctx=ctx)
+
+
+def gen_fortran_mangling(cfg, f, mangling):
+    suffix, uppername = fortran_manglings[mangling]
+    fname = f.meta.fname(f.name()).lower() + "_"
+    sname = f.meta.fname(f.name()).upper() if uppername else f.meta.fname(f.name()).lower()
+    sname += suffix
+
+    if cfg.alias_mode == "alias":
+        # Same body, no extra call frame
+        return "{} __attribute__((alias(\"{}\")));\n".format(fortran_proto(f, suffix, uppername), fname)
+    elif cfg.alias_mode == "weak":
+        return "#pragma weak {} = {}\n".format(sname, fname)
+
+    ret = fortran_proto(f, suffix, uppername) + "\n"
+    ret += "{\n"
+    # Hidden string lengths are forwarded as they were received
+    params = []
+    suffix_params = []
+    # Same parameters as fortran_proto()
+    for x in (f.params()[2:] if f.isinit() else f.params()):
+        if x.kind() == "STRING":
+            params.append("{} CHAR_MIXED_ARG(size_{})".format(x.name(), x.name()))
+            suffix_params.append("CHAR_END_ARG(size_{})".format(x.name()))
+        else:
+            params.append(x.name())
+    if [x for x in f.parameters if x.name() == "ierror"]:
+        params.append(" ".join(["ierror"] + suffix_params))
+    elif suffix_params:
+        params[-1] += " " + " ".join(suffix_params)
+
+    if f.return_kind() != "NOTHING":
+        ret += "\treturn {}({});\n".format(fname, ", ".join(params))
+    else:
+        ret += "\t{}({});\n".format(fname, ", ".join(params))
+    ret += "}\n"
+
+    return ret
+
+
+def gen_fortran_iface(cfg, f):
     # MPI Sizeof is handled separately
     if f.name() == "MPI_Sizeof":
-        return
-
+        return None
 
-    for p in f.parameters:
-        #
-        # Handle conversion all MPI Handles are Fint
-        #
-        if p.ishandle() and not p.kind() == "STATUS":
-            p.set_extern_fbind_type("MPI_Fint")
+    return gen_fortran_wrappers(cfg, f)
 
-    param_save = f.parameters
-    if f.isinit():
-        # In Fortran MPI Init only takes ierror
-        f.parameters = f.parameters[2:]
 
+def gen_fortran_wrappers(cfg, f):
     # The _ version
-    print(f.proto(suffix="_", lowername=True))
-    print("{")
+    out = fortran_proto(f) + "\n"
+    out += "{\n"
 
     if f.isinit():
-        # In Fortran MPI Init only takes ierror
-        f.parameters = param_save
-        print("int *argc = NULL;")
-        print("char ***argv = NULL;")
+        out += "int *argc = NULL;\n"
+        out += "char ***argv = NULL;\n"
 
 
     if f.name() != "MPI_F_sync_reg":
         # sync_reg has an empty body as it is just a way
         # to flush registers in a fortran program
-        ret, rename = parameter_in_conversion(f)
-        print(ret)
-        print(f.gen_call(rename=rename))
-        ret = parameter_out_conversion(f, rename)
-        print(ret)
-        print(f.gen_return())
-
-    print("}")
-
-    # The __ version
-    print(f.proto(suffix="__", lowername=True))
-    print("{")
-    fname = f.name().lower() + "_"
-    params = ", ".join([ x.name() for x in f.params()])
-
-    if fname != "mpi_wtime_":
-        print("\t{}({}, ierror);".format(fname, params))
-    else:
-        print("return mpi_wtime_();")
-    print("}")
+        ret, rename, ctx = parameter_in_conversion(cfg, f)
+        out += ret + "\n"
+        out += f.gen_call(rename=rename, ctx=ctx) + "\n"
+        if f.isinit():
+            # Sentinels are registered by the runtime initialization
+            out += "fortran_sentinels_resolve();\n"
+        ret = parameter_out_conversion(cfg, f, rename)
+        out += ret + "\n"
+        out += f.gen_return() + "\n"
+
+    out += "}\n"
+
+    # The other manglings
+    for m in cfg.manglings:
+        out += gen_fortran_mangling(cfg, f, m)
+
+    return out
 
 
 
@@ -359,5 +846,25 @@ def is_part_of_bindings(f):
         not f.isf08conv() and \
         not f.isvariadic()
 
-a.forall(gen_fortran_iface, is_part_of_bindings)
+def backend(opts):
+    cfg = MPI_Fortran_config(opts)
+    # Regular wrappers take the default Fortran integer kinds
+    meta = MPI_Standard_meta(lang="fbind", fprefix="", mpi_version=opts.mpi_version, bigcount=False)
+    return MPI_Backend("fbind", meta, is_part_of_bindings, lambda f: gen_fortran_iface(cfg, f),
+                       prelude=gen_prelude(cfg, meta),
+                       options={"identity_handles": cfg.identity_handles(),
+                                "alias_mode": cfg.alias_mode,
+                                "manglings": cfg.manglings,
+                                "large_count": cfg.large_count_meta is not None},
+                       large_count=cfg.large_count_meta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI Fortran Bindings Generation tool')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
 
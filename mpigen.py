@@ -0,0 +1,338 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from mpiiface import MPI_Interface
+
+
+# Interfaces and backends inherited by the forked workers
+_worker_state = None
+
+
+class MPI_Backend():
+
+    def __init__(self, name, meta, filter_callback, render, prelude="", separator="", postlude="", options=None, large_count=None):
+        self.name = name
+        self.meta = meta
+        self.filter_callback = filter_callback
+        # Returns the text for one function (None to skip it)
+        self.render = render
+        self.prelude = prelude
+        self.separator = separator
+        self.postlude = postlude
+        # Generation options changing the rendered text
+        self.options = options or {}
+        # Meta of the MPI 4 large count (_c) entry points, functions with
+        # larger types there are also rendered with it, after the plain one
+        self.large_count = large_count
+        self._hash = None
+
+    def content_hash(self):
+        # Covers the generator sources, the options and the kind map
+        if self._hash is None:
+            h = hashlib.sha256(self.name.encode())
+            # All the generator modules, backends share helper modules
+            here = os.path.dirname(os.path.abspath(__file__))
+            sources = glob.glob(os.path.join(here, "*.py"))
+            sources.append(os.path.abspath(sys.modules[self.render.__module__].__file__))
+            for path in sorted(set(sources), key=os.path.basename):
+                with open(path, "rb") as f:
+                    h.update(f.read())
+            h.update(json.dumps(self.options, sort_keys=True).encode())
+            h.update(self.meta.content_hash().encode())
+            if self.large_count:
+                h.update(self.large_count.content_hash().encode())
+            self._hash = h.hexdigest()
+        return self._hash
+
+
+class MPI_Fragment_cache():
+    """Rendered function text stored by function and backend hash"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, f, b):
+        # One tree per backend hash, see prune()
+        key = f.content_hash()
+        return os.path.join(self.path, b.name, b.content_hash(), key[:2], key)
+
+    def prune(self, backends):
+        # Trees of the other hashes of these backends (older sources or
+        # options) are never read again, a backend given twice with
+        # different options keeps both
+        current = {}
+        for b in backends:
+            current.setdefault(b.name, set()).add(b.content_hash())
+        for name, hashes in current.items():
+            try:
+                entries = os.listdir(os.path.join(self.path, name))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry not in hashes:
+                    shutil.rmtree(os.path.join(self.path, name, entry), ignore_errors=True)
+
+    def get(self, f, b):
+        # Returns (found, text), an entry that cannot be read back
+        # whole (truncated, corrupted) is a miss and gets rendered again
+        try:
+            with open(self._file(f, b), "r", newline="") as cached:
+                data = cached.read()
+        except (OSError, ValueError):
+            return False, None
+        header, sep, text = data.partition("\n")
+        if not sep:
+            return False, None
+        if header == "0" and not text:
+            return True, None
+        if header[:1] == "1" and header[1:].isdigit() and int(header[1:]) == len(text):
+            return True, text
+        return False, None
+
+    def put(self, f, b, text):
+        # Entries are "0" (filtered out) or "1<length>" and the text, readers
+        # only ever see a whole entry as it is renamed in place once written
+        path = self._file(f, b)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        except OSError:
+            # Tree pruned by a concurrent run with other options, the
+            # entry is only rendered again next time
+            return
+        try:
+            with open(fd, "w", newline="") as cached:
+                cached.write("0\n" if text is None else "1{}\n{}".format(len(text), text))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+
+class MPI_Output_sink():
+    """Accumulates rendered fragments and writes them in large chunks"""
+
+    def __init__(self, target=None, chunk_size=1 << 20):
+        # A path (opened and closed by the sink), a writable stream
+        # or None to keep the output in memory (see getvalue())
+        self._owned = isinstance(target, (str, os.PathLike))
+        if target is None:
+            self._stream = io.StringIO()
+        elif self._owned:
+            self._stream = open(target, "w")
+        else:
+            self._stream = target
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._size = 0
+
+    def write(self, text):
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._stream.write("".join(self._pending))
+            self._pending = []
+            self._size = 0
+        self._stream.flush()
+
+    def getvalue(self):
+        self.flush()
+        return self._stream.getvalue()
+
+    def close(self):
+        # Streams given by the caller are left open
+        self.flush()
+        if self._owned:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_output_argument(parser):
+    parser.add_argument('--output', '-o', default=None, metavar="FILE", type=str, help='Output file (defaults to the standard output)')
+
+
+def add_common_arguments(parser):
+    parser.add_argument('datafile', default="./prepass.dat", metavar="FILE", type=argparse.FileType('r'), nargs="?", help='Pre-generated JSON file extracted from documentation')
+    parser.add_argument('--standard', default="4.0.0", dest="mpi_version", metavar="VERSION", type=str, nargs="?", help='MPI version (defaults to 4.x)')
+    parser.add_argument('--model-cache', default=os.environ.get("MPI_META_MODEL_CACHE"), dest="model_cache", metavar="DIR", type=str, help='Store and reuse the parsed prepass model in this directory (defaults to $MPI_META_MODEL_CACHE)')
+    parser.add_argument('--cache-dir', default=None, dest="cache_dir", metavar="DIR", type=str, help='Reuse the text of unchanged functions from this directory')
+    parser.add_argument('--jobs', '-j', default=1, dest="jobs", metavar="N", type=int, help='Number of worker processes used to render the functions (defaults to 1)')
+
+
+def load_interfaces(datafile, backends, model_cache=None):
+    # Parse once, backends sharing a meta also share the functions
+    interfaces = {}
+    base = None
+
+    for b in backends:
+        key = b.meta.key()
+        if key in interfaces:
+            continue
+        if base is None:
+            base = MPI_Interface(datafile, b.meta, cache_dir=model_cache)
+            interfaces[key] = base
+        else:
+            interfaces[key] = base.rebind(b.meta)
+
+    return base, interfaces
+
+
+def _render_one(f, b):
+    if not b.filter_callback(f):
+        return None
+    texts = [b.render(f)]
+    large = f.large_count_variant(b.large_count)
+    if large:
+        texts.append(b.render(large))
+    texts = [t for t in texts if t is not None]
+    return b.separator.join(texts) if texts else None
+
+
+def _render(interfaces, backends, names, cache=None):
+    # One row per function with the text of each backend (None if skipped)
+    ret = []
+    for name in names:
+        row = []
+        for b in backends:
+            f = interfaces[b.meta.key()].functions[name]
+            if cache:
+                found, text = cache.get(f, b)
+                if not found:
+                    text = _render_one(f, b)
+                    cache.put(f, b, text)
+            else:
+                text = _render_one(f, b)
+            row.append(text)
+        ret.append(row)
+    return ret
+
+
+def _render_shard(names):
+    interfaces, backends, cache = _worker_state
+    return _render(interfaces, backends, names, cache)
+
+
+def _render_parallel(interfaces, backends, names, jobs, cache):
+    global _worker_state
+
+    # Contiguous shards of the sorted list, a few per worker to balance
+    # the load, results are then consumed in name order
+    nshards = jobs * 4
+    step = max(1, (len(names) + nshards - 1) // nshards)
+    shards = [names[i:i + step] for i in range(0, len(names), step)]
+
+    _worker_state = (interfaces, backends, cache)
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            for rows in pool.imap(_render_shard, shards):
+                yield rows
+    finally:
+        _worker_state = None
+
+
+def generate(datafile, backends, outputs, jobs=1, cache_dir=None, model_cache=None):
+    """Stream every function through all the backends in a single pass
+
+    Outputs are MPI_Output_sink objects, paths or writable streams"""
+    base, interfaces = load_interfaces(datafile, backends, model_cache)
+    own = [not isinstance(out, MPI_Output_sink) for out in outputs]
+    outputs = [MPI_Output_sink(out) if o else out for out, o in zip(outputs, own)]
+    names = [f.name() for f in base.sorted_functions()]
+    cache = MPI_Fragment_cache(cache_dir) if cache_dir else None
+
+    for b, out in zip(backends, outputs):
+        out.write(b.prelude)
+
+    first = [True] * len(backends)
+
+    # Workers inherit the model by forking, otherwise stay serial
+    if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+        # Nothing may be left buffered for the workers to inherit and
+        # write again, they only return text and the parent writes it
+        for out in outputs:
+            out.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        shards = _render_parallel(interfaces, backends, names, jobs, cache)
+    else:
+        shards = [_render(interfaces, backends, names, cache)]
+
+    for rows in shards:
+        for row in rows:
+            for i, text in enumerate(row):
+                if text is None:
+                    continue
+                if not first[i]:
+                    outputs[i].write(backends[i].separator)
+                first[i] = False
+                outputs[i].write(text)
+
+    for b, out, o in zip(backends, outputs, own):
+        out.write(b.postlude)
+        if o:
+            out.close()
+        else:
+            out.flush()
+
+    if cache:
+        cache.prune(backends)
+
+
+if __name__ == "__main__":
+    import cf08bind
+    import cfbind
+    import mpiheader
+    import mpijson
+    import mpiprof
+    import mpitrace
+    import mpitraffic
+
+    parser = argparse.ArgumentParser(description='MPI Bindings Generation driver')
+    add_common_arguments(parser)
+    parser.add_argument('--header', metavar="FILE", type=str, help='Output file for the C header')
+    parser.add_argument('--fbind', metavar="FILE", type=str, help='Output file for the Fortran bindings')
+    parser.add_argument('--f08bind', metavar="FILE", type=str, help='Output file for the mpi_f08 bindings')
+    parser.add_argument('--json', metavar="FILE", type=str, help='Output file for the JSON view')
+    parser.add_argument('--doxygen', metavar="FILE", type=str, help='Output file for the doxygen documentation')
+    parser.add_argument('--prof', metavar="FILE", type=str, help='Output file for the PMPI profiling library')
+    parser.add_argument('--trace', metavar="FILE", type=str, help='Output file for the PMPI tracing library')
+    parser.add_argument('--traffic', metavar="FILE", type=str, help='Output file for the PMPI traffic matrix collector')
+    cfbind.add_arguments(parser)
+    args = parser.parse_args()
+
+    backends = []
+    outputs = []
+
+    for path, make_backend in ((args.header, mpiheader.backend),
+                               (args.fbind, cfbind.backend),
+                               (args.f08bind, cf08bind.backend),
+                               (args.json, mpijson.backend),
+                               (args.doxygen, mpiheader.doxygen_backend),
+                               (args.prof, mpiprof.backend),
+                               (args.trace, mpitrace.backend),
+                               (args.traffic, mpitraffic.backend)):
+        if path:
+            backends.append(make_backend(args))
+            outputs.append(path)
+
+    if not backends:
+        parser.error("No output requested")
+
+    generate(args.datafile, backends, outputs, jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
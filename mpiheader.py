@@ -1,21 +1,20 @@
-from mpiiface import MPI_Interface, MPI_Standard_meta
+from mpiiface import MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
 import argparse
+import sys
 
 
-parser = argparse.ArgumentParser(description='MPI Interface Generation tool')
-parser.add_argument('datafile', default="./prepass.dat", metavar="FILE", type=argparse.FileType('r'), nargs="?", help='Pre-generated JSON file extracted from documentation')
-parser.add_argument('--standard', default="4.0.0", dest="mpi_version", metavar="VERSION", type=str, nargs="?", help='MPI version (defaults to 4.x)')
-
-args = parser.parse_args()
-a = MPI_Interface(args.datafile, MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version))
+def gen_c_iface(f):
+	ret = "\n\n"
+	ret += "/*{}*/\n".format(f.meta.fname(f.name()))
+	ret += f.doxygen() + "\n"
+	ret += "{};\n".format(f.proto())
+	ret += "{};\n".format(f.proto(prefix="P"))
+	return ret
 
 
-def gen_c_iface(f):
-	print("\n")
-	print("/*{}*/".format(f.name()))
-	print(f.doxygen())
-	print("{};".format(f.proto()))
-	print("{};".format(f.proto(prefix="P")))
+def gen_doxygen(f):
+	return f.doxygen(fn=True) + "\n"
 
 
 
@@ -26,4 +25,21 @@ def is_part_of_bindings(f):
         not f.isf08conv()
 
 
-a.forall(gen_c_iface, is_part_of_bindings)
+def backend(args):
+	# Plain names keep the int counts, MPI 4 large counts are the _c functions
+	meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+	return MPI_Backend("header", meta, is_part_of_bindings, gen_c_iface, large_count=meta.large_count())
+
+
+def doxygen_backend(args):
+	meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+	return MPI_Backend("doxygen", meta, is_part_of_bindings, gen_doxygen, large_count=meta.large_count())
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='MPI Interface Generation tool')
+	add_common_arguments(parser)
+	add_output_argument(parser)
+	args = parser.parse_args()
+
+	generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
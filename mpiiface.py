@@ -1,51 +1,206 @@
 import json
-import copy
-from bindingtypes import BIG_C_KIND_MAP, SMALL_C_KIND_MAP
+import hashlib
+import marshal
+import os
+import sys
+import bindingtypes
+
+
+# C types of the Fortran integer kinds
+_F90_C_TYPES = {
+    "INTEGER": "int",
+    "INTEGER(KIND=MPI_ADDRESS_KIND)": "MPI_Aint",
+    "INTEGER(KIND=MPI_COUNT_KIND)": "MPI_Count",
+    "INTEGER(KIND=MPI_OFFSET_KIND)": "MPI_Offset",
+}
+
+
+def _intern(value):
+    # Kinds and names are repeated all over the standard
+    return sys.intern(value) if isinstance(value, str) else value
 
 class MPI_Standard_meta():
 
-    def __init__(self, lang="std", fprefix="", fsuffix="", mpi_version="4.0.0"):
+    def __init__(self, lang="std", fprefix="", fsuffix="", mpi_version="4.0.0", bigcount=None):
         varray = [int(c) for c in mpi_version.split(".") ]
-        self._std2ckindmap = BIG_C_KIND_MAP if varray[0] >= 4 else SMALL_C_KIND_MAP
+        # Large count types by default from MPI 4
+        self._bigcount = varray[0] >= 4 if bigcount is None else bigcount
+        self._kindmap = None
+        self.mpi_version = mpi_version
         self.lang = lang
         self.fprefix = fprefix
         self.fsuffix = fsuffix
+        self._hash = None
+        # Derived parameter type strings by parameter signature
+        self._param_types = {}
+
+    def key(self):
+        # Metas with the same key expand functions the same way
+        return (self.lang, self.fprefix, self.fsuffix, self._bigcount)
+
+    def content_hash(self):
+        # Stable across runs, covers the kind map used for expansion
+        if self._hash is None:
+            h = hashlib.sha256(json.dumps(self.key()).encode())
+            h.update(json.dumps(self._std2ckindmap(), sort_keys=True).encode())
+            self._hash = h.hexdigest()
+        return self._hash
 
     def fname(self, name):
         return self.fprefix + name + self.fsuffix
 
+    def large_count(self):
+        # Meta of the MPI 4 large count (_c) entry points, the plain
+        # names keep the small count types. None before MPI 4
+        if int(self.mpi_version.split(".")[0]) < 4:
+            return None
+        return MPI_Standard_meta(lang=self.lang, fprefix=self.fprefix, fsuffix=self.fsuffix + "_c",
+                                 mpi_version=self.mpi_version, bigcount=True)
+
+    def _std2ckindmap(self):
+        # Kind maps are built on first use, only fetch the one we need
+        if self._kindmap is None:
+            if self.lang == "fbind":
+                self._kindmap = self._fbind_kindmap()
+            elif self.lang == "f08bind":
+                self._kindmap = self._f08bind_kindmap()
+            else:
+                self._kindmap = bindingtypes.BIG_C_KIND_MAP if self._bigcount else bindingtypes.SMALL_C_KIND_MAP
+        return self._kindmap
+
+    def _fbind_kindmap(self, fmap=None):
+        # Counts and displacements are received with the integer
+        # kinds of the Fortran interface (MPI_COUNT_KIND for _c)
+        if fmap is None:
+            fmap = bindingtypes.BIG_F90_KIND_MAP if self._bigcount else bindingtypes.SMALL_F90_KIND_MAP
+        ret = dict(bindingtypes.SMALL_C_KIND_MAP)
+        for kind, ftype in fmap.items():
+            if kind.startswith("POLY") and ftype in _F90_C_TYPES:
+                ret[kind] = _F90_C_TYPES[ftype]
+        return ret
+
+    def _f08bind_kindmap(self):
+        # Same translation with the kinds of the mpi_f08 module
+        return self._fbind_kindmap(bindingtypes.BIG_F08_KIND_MAP if self._bigcount else bindingtypes.SMALL_F08_KIND_MAP)
+
+    def isfbind(self):
+        # C side of one of the Fortran interfaces
+        return self.lang in ("fbind", "f08bind")
+
+    def f08type(self, kind):
+        # Type of the kind in the mpi_f08 module (e.g. TYPE(MPI_Comm))
+        return bindingtypes.BASE_F08_KIND_MAP.get(kind)
+
     def _kind_expand_c(self, kind):
-        if kind in self._std2ckindmap:
-            return self._std2ckindmap[kind]
+        kindmap = self._std2ckindmap()
+        if kind in kindmap:
+            return kindmap[kind]
         else:
             return "ERR"
 
     def kind_expand(self, kind):
         if self.lang == "std":
             return kind
-        elif self.lang == "c" or self.lang == "fbind":
+        elif self.lang == "c" or self.isfbind():
             return self._kind_expand_c(kind)
         else:
             raise Exception("No such kind expand")
 
+    def param_types(self, param):
+        # Parameters with the same signature expand to the same strings
+        key = param.signature()
+        ret = self._param_types.get(key)
+        if ret is None:
+            ret = param._compute_types()
+            self._param_types[key] = ret
+        return ret
+
+
+class MPI_Render_context():
+    """Overrides applied when rendering a function, never modified in place"""
+
+    __slots__ = ("_types", "_refs", "_skip")
+
+    def __init__(self, types=None, refs=None, skip=0):
+        # Parameter name to type replacing its kind expansion
+        self._types = dict(types or {})
+        # Parameter name to prefix used when passing it in calls
+        self._refs = dict(refs or {})
+        # Number of leading parameters left out of the prototype
+        self._skip = skip
+
+    def with_types(self, types):
+        merged = dict(self._types)
+        merged.update(types)
+        return MPI_Render_context(merged, self._refs, self._skip)
+
+    def with_refs(self, refs):
+        merged = dict(self._refs)
+        merged.update(refs)
+        return MPI_Render_context(self._types, merged, self._skip)
+
+    def with_skip(self, skip):
+        return MPI_Render_context(self._types, self._refs, skip)
+
+    def param_type(self, param, default=None):
+        return self._types.get(param.name(), default)
+
+    def param_ref(self, param, default=None):
+        return self._refs.get(param.name(), default)
+
+    def params(self, parameters):
+        return parameters[self._skip:]
+
+
+_empty_context = MPI_Render_context()
+
 
 class MPI_Parameter():
 
+    __slots__ = ("meta", "content", "_name", "_kind", "_types")
+
     def __init__(self, content, meta=None):
         self.meta = meta
-        self.content = content.copy()
-        self.fbind_type = None
-        self.fbind_noderef = False
-        self.fbind_getref=False
+        # Shared with the prepass record, not modified
+        self.content = content
+        self._name = _intern(content.get("name"))
+        self._kind = _intern(content.get("kind"))
+        self._types = None
+
+    @classmethod
+    def _from_table(cls, content, meta, row):
+        # Row of the model cache, names and kinds are interned already
+        ret = cls.__new__(cls)
+        ret.meta = meta
+        ret.content = content
+        ret._name, ret._kind, ret._types = row
+        return ret
 
-    def _get_attr(self, attr):
-        if attr in self.content:
-            return self.content[attr]
-        else:
-            return None
+    def _table_row(self):
+        return (self._name, self._kind, self._derived())
 
-    def set_extern_fbind_type(self, type):
-        self.fbind_type = type
+    def _get_attr(self, attr):
+        return self.content.get(attr)
+
+    def signature(self):
+        # Everything the derived type strings depend on
+        length = self.length()
+        if isinstance(length, list):
+            length = tuple(length)
+        return (self._kind, self.pointer(), length, self.intent(),
+                self.constant(), self._get_attr("func_type"))
+
+    def _compute_types(self):
+        c_pointer = self._compute_c_pointer()
+        c_array = self._compute_c_array()
+        kind = self._compute_kind_expand()
+        full = "{}{}{}{}".format("const " if self.constant() else "", kind, c_pointer, c_array)
+        return (c_pointer, c_array, _intern(kind), _intern(full))
+
+    def _derived(self):
+        if self._types is None:
+            self._types = self.meta.param_types(self)
+        return self._types
 
     def ishandle(self):
         handle_kind = ["INFO",
@@ -70,8 +225,11 @@ class MPI_Parameter():
         return isinstance(self._get_attr("length"), list)
 
     def _get_c_pointer(self):
+        return self._derived()[0]
+
+    def _compute_c_pointer(self):
 
-        if self.meta.lang != "c" and self.meta.lang != "fbind":
+        if self.meta.lang != "c" and not self.meta.isfbind():
             return ''
 
         if self.pointer() is not None and not self.pointer():
@@ -105,7 +263,10 @@ class MPI_Parameter():
         return ''
 
     def get_c_array(self):
-        if self.meta.lang != "c" and self.meta.lang != "fbind":
+        return self._derived()[1]
+
+    def _compute_c_array(self):
+        if self.meta.lang != "c" and not self.meta.isfbind():
             return ''
         # Add "[]" if:
         # - This is not a STRING, and
@@ -146,12 +307,6 @@ class MPI_Parameter():
     def fbindpointer(self):
         return "*" if (not self._get_c_pointer() and not self.get_c_array()) else ""
 
-    def setfbindnoderef(self):
-         self.fbind_noderef=True
-
-    def setfbindgetref(self):
-         self.fbind_getref=True
-
     def desc(self):
         return self._get_attr("desc")
 
@@ -171,7 +326,14 @@ class MPI_Parameter():
     def constant(self):
         return self._get_attr("constant")
 
+    def isrootonly(self):
+        # Only significant at the root of a collective
+        return bool(self._get_attr("root_only"))
+
     def kind_expand(self):
+        return self._derived()[2]
+
+    def _compute_kind_expand(self):
         if (self.kind() == "FUNCTION") or (self.kind() == "FUNCTION_SMALL") or self.kind() == "POLYFUNCTION":
             return self._get_attr("func_type")
         else:
@@ -181,9 +343,7 @@ class MPI_Parameter():
         return ("const " if self.constant() and not noconst else "") + self.kind_expand()
 
     def type_full_c(self):
-        return "{}{}{}".format( self.type_c(),
-                                 self._get_c_pointer(),
-                                 self.get_c_array())
+        return self._derived()[3]
 
     def type_c_is_pointer(self):
         return (self._get_c_pointer() == "*")
@@ -194,14 +354,9 @@ class MPI_Parameter():
                                    self.name(),
                                    self.get_c_array())
 
-    def str_fbind(self):
-        
-        if self.fbind_type:
-            # Was type temporarilly overridden ?
-            ftype = self.fbind_type
-            self.fbind_type = None
-        else:
-            ftype = self.kind_expand()
+    def str_fbind(self, ctx=_empty_context):
+        # The context may override the type (e.g. handles as MPI_Fint)
+        ftype = ctx.param_type(self) or self.kind_expand()
 
         ftype += self.fbindpointer()
         return "{}{} {}{}{}".format("const " if self.constant() else "",
@@ -213,7 +368,7 @@ class MPI_Parameter():
     def __str__(self):
         if self.meta.lang == "c":
             return self.str_c()
-        elif self.meta.lang == "fbind":
+        elif self.meta.isfbind():
             return self.str_fbind()
         else:
             return "{} {}".format(self.kind(), self.name())
@@ -222,31 +377,67 @@ class MPI_Parameter():
         return  " * @param {0} {1}".format(self.name(), self.desc()) 
 
     def kind(self):
-        return self._get_attr("kind")
+        return self._kind
 
     def name(self):
-        if self.kind() == "VARARGS":
+        if self._kind == "VARARGS":
             return ""
-        return self._get_attr("name")
+        return self._name
 
     def set_name(self, name):
-        self.content["name"] = name
+        self._name = name
 
 
 
 class MPI_Function():
 
+    __slots__ = ("meta", "content", "_name", "_return_kind", "parameters", "_hash")
+
     def _register_parameters(self, meta=None):
-        self.parameters = []
-        if "parameters" in self.content:
-            for p in self.content["parameters"]:
-                self.parameters.append(MPI_Parameter(p, meta))
+        self.parameters = [MPI_Parameter(p, meta) for p in self.content.get("parameters", ())]
 
     def __init__(self, content, meta=None):
         self.meta = meta
-        self.content = content.copy()
+        # Shared with the prepass record, not modified
+        self.content = content
+        self._name = _intern(content.get("name"))
+        self._return_kind = _intern(content.get("return_kind"))
+        self._hash = None
         self._register_parameters(meta)
 
+    @classmethod
+    def _from_table(cls, content, meta, row):
+        name, return_kind, params = row
+        ret = cls.__new__(cls)
+        ret.meta = meta
+        ret.content = content
+        ret._name = name
+        ret._return_kind = return_kind
+        ret._hash = None
+        ret.parameters = [MPI_Parameter._from_table(c, meta, r) for c, r in zip(content.get("parameters", ()), params)]
+        return ret
+
+    def _table_row(self):
+        return (self._name, self._return_kind, [p._table_row() for p in self.parameters])
+
+    def large_count_variant(self, meta):
+        # The function expanded with a large count meta when some of
+        # its counts or displacements get larger types there
+        if meta is None:
+            return None
+        large = MPI_Function(self.content, meta)
+        for p, lp in zip(self.parameters, large.parameters):
+            if p.kind_expand() != lp.kind_expand():
+                return large
+        return None
+
+    def content_hash(self):
+        # Stable hash of the function record from the prepass
+        if self._hash is None:
+            record = json.dumps(self.content, sort_keys=True)
+            self._hash = hashlib.sha256(record.encode()).hexdigest()
+        return self._hash
+
     def params(self):
         if self.meta.lang == "c" or self.meta.lang:
             #No Ierror
@@ -254,49 +445,51 @@ class MPI_Function():
         else:
             return self.parameters
 
-    def _gen_fbind_paramlist(self):
+    def _gen_fbind_paramlist(self, ctx):
         # We need to add string suffixes and inline args
         # depending on the fortran support type
         ret = []
         suffix_ret = []
         
-        for p in self.parameters:
+        for p in ctx.params(self.parameters):
             if p.kind() == "STRING":
-                ret.append("{} CHAR_MIXED(size_{})".format(str(p), p.name()))
+                ret.append("{} CHAR_MIXED(size_{})".format(p.str_fbind(ctx), p.name()))
                 suffix_ret.append("CHAR_END(size_{})".format(p.name()))
             else:
-                ret.append(str(p))
+                ret.append(p.str_fbind(ctx))
 
         if suffix_ret:
             ret[-1] += " " + " ".join(suffix_ret)
 
         return ret
 
-    def proto(self, prefix="", suffix="", lowername=False):
+    def proto(self, prefix="", suffix="", lowername=False, uppername=False, ctx=_empty_context):
         if self.meta.lang == "c":
-            str_params = [str(x) for x in self.params()]
+            str_params = [str(x) for x in ctx.params(self.params())]
         else:
             if self.meta.lang == "fbind":
-                str_params = self._gen_fbind_paramlist()
+                str_params = self._gen_fbind_paramlist(ctx)
+            elif self.meta.lang == "f08bind":
+                # No hidden string lengths and errors are returned
+                str_params = [x.str_fbind(ctx) for x in ctx.params(self.params())]
             else:
-                str_params = [str(x) for x in self.parameters]
+                str_params = [str(x) for x in ctx.params(self.parameters)]
 
-        fname = self.name()
+        fname = self.meta.fname(self.name())
         if lowername:
             fname = fname.lower()
+        elif uppername:
+            fname = fname.upper()
 
         return "{} {}({})".format(self.meta.kind_expand(self.return_kind()),
-                                  prefix + self.meta.fname(fname) + suffix,
+                                  prefix + fname + suffix,
                                   ", ".join(str_params))
 
     def __str__(self):
         return self.proto()
 
     def _get_attr(self, attr):
-        if attr in self.content:
-            return self.content[attr]
-        else:
-            return None
+        return self.content.get(attr)
 
     def isf08conv(self):
         return (self.name().find("f2f08") != -1) or (self.name().find("f082f") != -1)
@@ -319,8 +512,7 @@ class MPI_Function():
                           rename=None,
                           use_ierror=False,
                           lowername=False):
-        if self.return_kind() != "NOTHING":
-            has_ret_val = 1
+        has_ret_val = self.return_kind() != "NOTHING"
 
         call=""
 
@@ -331,17 +523,12 @@ class MPI_Function():
                 call+="{} {} = ".format(self.meta.kind_expand(self.return_kind()),
                                     var)
 
-        if rename:
-            # Make sure to copy as we edit the array
-            loc_params = copy.deepcopy(self.params())
-            for p in loc_params:
-                name = p.name()
-                if name in rename:
-                    p.set_name(rename[name])
-        else:
-            loc_params = self.params()
-
-        str_params = [param_cb(x) for x in loc_params]
+        # Renamed parameters are only substituted in the call text
+        rename = rename or {}
+        str_params = []
+        for x in self.params():
+            name = x.name()
+            str_params.append(param_cb(x, rename.get(name, name)))
 
         fname = self.meta.fname(self.name())
         if lowername:
@@ -353,31 +540,28 @@ class MPI_Function():
         return call
 
     def _gen_call_c(self, var = "ret", fprefix="", fsuffix="", rename=None, lowername=False):
-        def c_param(param):
-            return param.name()
+        def c_param(param, name):
+            return name
         return self._gen_call_generic(c_param, var, fprefix, fsuffix, rename)
 
 
-    def _gen_call_fbind(self, var = "ret", fprefix="", fsuffix="", rename=None):
-        def f_param(param):
-                    # We need to add reference to non pointer types
-        # and output pointers
-            if param.fbind_getref == True:
-                ptr = "&"
-                param.fbind_getref = False
-            elif param.fbind_noderef == True:
-                ptr = ""
-                param.fbind_noderef = False
-            else:
+    def _gen_call_fbind(self, var = "ret", fprefix="", fsuffix="", rename=None, ctx=_empty_context, use_ierror=True):
+        def f_param(param, name):
+            # We need to add reference to non pointer types
+            # and output pointers unless the context says otherwise
+            ptr = ctx.param_ref(param)
+            if ptr is None:
                 ptr = param.fbindpointer()
-            return ptr + param.name()
-        return self._gen_call_generic(f_param, var, fprefix, fsuffix, rename, use_ierror=True)
+            return ptr + name
+        return self._gen_call_generic(f_param, var, fprefix, fsuffix, rename, use_ierror=use_ierror)
 
-    def gen_call(self, var="ret", fprefix="", fsuffix="", rename=None):
+    def gen_call(self, var="ret", fprefix="", fsuffix="", rename=None, ctx=_empty_context):
         if self.meta.lang == "c":
             return self._gen_call_c(var, fprefix, fsuffix, rename)
         elif self.meta.lang == "fbind":
-            return self._gen_call_fbind(var, fprefix, fsuffix, rename)
+            return self._gen_call_fbind(var, fprefix, fsuffix, rename, ctx)
+        elif self.meta.lang == "f08bind":
+            return self._gen_call_fbind(var, fprefix, fsuffix, rename, ctx, use_ierror=False)
         return ""
 
     def _gen_return_c(self):
@@ -385,16 +569,26 @@ class MPI_Function():
             return ""
         return "return ret;"
 
+    def _gen_return_fbind(self):
+        if self.return_kind() == "NOTHING":
+            return ""
+        # The error code was stored in ierror by the call
+        if self.return_kind() == "ERROR_CODE" and self._has_ierror():
+            return "return *ierror;"
+        return "return ret;"
+
     def gen_return(self):
-        if self.meta.lang == "c":
+        if self.meta.lang in ("c", "f08bind"):
             return self._gen_return_c()
+        elif self.meta.lang == "fbind":
+            return self._gen_return_fbind()
         return ""
 
     def return_kind(self):
-        return self._get_attr("return_kind")
+        return self._return_kind
 
     def name(self):
-        return self._get_attr("name")
+        return self._name
 
     def iscallback(self):
         attrs = self._get_attr("attributes")
@@ -408,6 +602,10 @@ class MPI_Function():
         attrs = self._get_attr("attributes")
         return attrs["f90_expressible"]
 
+    def isf08(self):
+        attrs = self._get_attr("attributes")
+        return attrs["f08_expressible"]
+
     def iscallback(self):
         attrs = self._get_attr("attributes")
         return attrs["callback"]
@@ -431,6 +629,27 @@ class MPI_Function():
     def get_param_by_kind(self, kind):
         return [ x for x in self.parameters if x.kind() == kind]
 
+    def buffer_triplets(self):
+        # (buffer, count, datatype) parameters describing a message, the
+        # count and datatype are attached to the closest buffer before
+        # them (e.g. recvbuf for MPI_Reduce). Arrays are not matched.
+        ret = []
+        buf = None
+        count = None
+        for p in self.parameters:
+            if p.kind() == "BUFFER":
+                buf = p
+                count = None
+            elif p.length() is not None:
+                continue
+            elif p.kind().startswith("POLYXFER_NUM_ELEM") and buf:
+                count = p
+            elif p.kind() == "DATATYPE" and count:
+                ret.append((buf, count, p))
+                buf = None
+                count = None
+        return ret
+
     def iscollective(self):
         coll_names = ["gather", "scatter", "reduce", "bcast", "alltoall", "barrier"]
         lname = self.name().lower()
@@ -442,8 +661,11 @@ class MPI_Function():
     def isinit(self):
         return self.name() in ["MPI_Init", "MPI_Init_thread"]
 
-    def doxygen(self):
-        brief = "MPI function {}".format(self.name())
+    def doxygen(self, fn=False):
+        brief = "MPI function {}".format(self.meta.fname(self.name()))
+        if fn:
+            # Standalone documentation block
+            brief += "\n * @fn {}".format(self.proto())
         params = "\n".join([x.doxygen() for x in self.params()])
         if not params:
             params = " *"
@@ -477,23 +699,109 @@ class MPI_Interface():
     def _load_content(self, f):
         self.standard_content = json.load(f)
 
+    def _model_digest(self, data):
+        # Marshal data is only valid for a given python version
+        h = hashlib.sha256(data)
+        with open(__file__, "rb") as src:
+            h.update(src.read())
+        h.update(repr(sys.version_info[:2]).encode())
+        return h.hexdigest()
+
+    def _cache_path(self, kind, key):
+        return os.path.join(self._cache_dir, "{}-{}.bin".format(kind, key))
+
+    def _cache_load(self, path):
+        try:
+            with open(path, "rb") as cached:
+                return marshal.loads(cached.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _cache_store(self, path, value):
+        # Only an optimization, a missing or read-only directory costs
+        # the parsing of the next run
+        tmp = "{}.{}".format(path, os.getpid())
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(tmp, "wb") as cached:
+                cached.write(marshal.dumps(value))
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _load_content_cached(self, f):
+        # Bytes are hashed and parsed without decoding them
+        data = getattr(f, "buffer", f).read()
+        if isinstance(data, str):
+            data = data.encode()
+        self._digest = self._model_digest(data)
+        path = self._cache_path("model", self._digest)
+
+        self.standard_content = self._cache_load(path)
+        if not isinstance(self.standard_content, dict):
+            self.standard_content = json.loads(data)
+            self._cache_store(path, self.standard_content)
+
     def _load_function(self, meta=None):
         self.functions = {}
         for k, v in self.standard_content.items():
             self.functions[k] = MPI_Function(v, meta)
+        # Do some sorting for more elegant output
+        self._sorted = sorted(self.functions.values(), key=lambda f: f.name())
 
-    def __init__(self, path, meta=MPI_Standard_meta()):
+    def _load_table(self, table):
+        self.functions = {}
+        for k, row in table:
+            self.functions[k] = MPI_Function._from_table(self.standard_content[k], self.meta, row)
+        self._sorted = sorted(self.functions.values(), key=lambda f: f.name())
+
+    def _load_function_cached(self):
+        # The function table once normalized for this meta: names and
+        # kinds interned, parameter types expanded
+        path = self._cache_path("table-{}".format(self._digest), self.meta.content_hash())
+        table = self._cache_load(path)
+        if table is not None:
+            try:
+                self._load_table(table)
+                return
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        self._load_function(self.meta)
+        self._cache_store(path, [(k, f._table_row()) for k, f in self.functions.items()])
+
+    def __init__(self, path, meta=MPI_Standard_meta(), cache_dir=None):
         self.meta = meta
-        self._load_content(path)
-        self._load_function(meta)
+        self._cache_dir = cache_dir
+        if cache_dir:
+            self._load_content_cached(path)
+            self._load_function_cached()
+        else:
+            self._load_content(path)
+            self._load_function(meta)
+
+    def rebind(self, meta):
+        # Same parsed content, functions expanded with another meta
+        ret = MPI_Interface.__new__(MPI_Interface)
+        ret.meta = meta
+        ret.standard_content = self.standard_content
+        ret._cache_dir = self._cache_dir
+        if self._cache_dir:
+            ret._digest = self._digest
+            ret._load_function_cached()
+        else:
+            ret._load_function(meta)
+        return ret
 
-    def forall(self, callback, filter_callback=None):
+    def sorted_functions(self):
+        return self._sorted
 
-        # Do some sorting for more elegant output
-        func = [ f for f in self.functions.values()]
-        func.sort(key=lambda f: f.name())
+    def forall(self, callback, filter_callback=None):
 
-        for f in func:
+        for f in self._sorted:
             if filter_callback and not filter_callback(f):
                 continue
             callback(f)
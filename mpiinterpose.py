@@ -0,0 +1,35 @@
+"""Helpers shared by the generated PMPI interposition libraries"""
+
+
+def is_interposable(f):
+    # Variadic functions (MPI_Pcontrol) cannot be forwarded generically,
+    # handle conversions are usually macros or inlined by the runtime
+    return f.isbindings() and \
+        f.isc() and \
+        not f.iscallback() and \
+        not f.isf08conv() and \
+        not f.isvariadic() and \
+        not f.name().endswith(("_f2c", "_c2f"))
+
+
+def gen_wrapper(f, before="", after="", decl=""):
+    """MPI_X definition forwarding to PMPI_X with code around the call"""
+    ret = "\n/* {} */\n".format(f.name())
+    ret += decl
+    ret += "{}\n{{\n".format(f.proto())
+    ret += before
+    ret += f.gen_call(fprefix="P") + "\n"
+    ret += after
+    ret += f.gen_return() + "\n"
+    ret += "}\n"
+    return ret
+
+
+def gen_pcontrol(f, body):
+    """MPI_Pcontrol definition, only the level is forwarded"""
+    ret = "\n/* {} */\n".format(f.name())
+    ret += "{}\n{{\n".format(f.proto())
+    ret += body
+    ret += "return PMPI_Pcontrol({});\n".format(f.params()[0].name())
+    ret += "}\n"
+    return ret
@@ -1,14 +1,17 @@
 import json
+import argparse
+import sys
 
-from mpiiface import MPI_Interface, MPI_Standard_meta
-with open("./prepass.dat", "r") as f:
-	a = MPI_Interface(f, MPI_Standard_meta(lang="c", fprefix=""))
+from mpiiface import MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
 
-the_json = {}
 
 def gen_c_iface(f):
 	params = [ [p.type_full_c(), p.name()] for p in f.params()]
-	the_json[f.name()] = params
+	# Same text as if the entry was dumped as part of the whole
+	# sorted dictionnary so that fragments can be streamed
+	value = json.dumps(params, indent=4).replace("\n", "\n    ")
+	return "    {}: {}".format(json.dumps(f.meta.fname(f.name())), value)
 
 
 
@@ -19,7 +22,17 @@ def is_part_of_bindings(f):
         not f.isf08conv()
 
 
-a.forall(gen_c_iface, is_part_of_bindings)
+def backend(args):
+	meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+	return MPI_Backend("json", meta, is_part_of_bindings, gen_c_iface,
+	                   prelude="{\n", separator=",\n", postlude="\n}\n",
+	                   large_count=meta.large_count())
 
 
-print(json.dumps(the_json, indent=4, sort_keys=True))
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='MPI JSON Interface Generation tool')
+	add_common_arguments(parser)
+	add_output_argument(parser)
+	args = parser.parse_args()
+
+	generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
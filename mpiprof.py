@@ -0,0 +1,412 @@
+from mpiiface import MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
+from mpiinterpose import is_interposable, gen_wrapper, gen_pcontrol
+import argparse
+import sys
+
+
+PRELUDE = """#include <mpi.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+	#include <x86intrin.h>
+#endif
+
+#ifndef MPIPROF_MAX_FUNCTIONS
+	#define MPIPROF_MAX_FUNCTIONS 1024
+#endif
+
+/* Message sizes: 0 then [2^(b-1), 2^b) bytes, the last bucket is open */
+#ifndef MPIPROF_SIZE_BUCKETS
+	#define MPIPROF_SIZE_BUCKETS 40
+#endif
+
+/* Datatype sizes cached per thread, must be a power of two */
+#ifndef MPIPROF_TYPE_CACHE
+	#define MPIPROF_TYPE_CACHE 64
+#endif
+
+struct mpiprof_fn
+{
+	const char *name;
+	int         id;
+};
+
+struct mpiprof_counter
+{
+	uint64_t calls;
+	uint64_t ticks;
+	uint64_t max_ticks;
+	uint64_t bytes;
+	uint64_t sizes[MPIPROF_SIZE_BUCKETS];
+};
+
+struct mpiprof_type
+{
+	MPI_Datatype datatype;
+	uint64_t     generation;
+	uint64_t     size;
+};
+
+/* Only written by its thread, read when dumping */
+struct mpiprof_thread
+{
+	struct mpiprof_counter counters[MPIPROF_MAX_FUNCTIONS];
+	struct mpiprof_type    types[MPIPROF_TYPE_CACHE];
+	struct mpiprof_thread *next;
+};
+
+/* Functions get an id on their first call */
+static struct mpiprof_fn *__mpiprof_fns[MPIPROF_MAX_FUNCTIONS];
+static int __mpiprof_fn_count = 0;
+
+static struct mpiprof_thread *__mpiprof_threads = NULL;
+static __thread struct mpiprof_thread *__mpiprof_self = NULL;
+
+/* Toggled by MPI_Pcontrol */
+static int __mpiprof_enabled = 1;
+
+/* Bumped by MPI_Type_free, handles may then be reused. Starts at 1 so that
+ * the zeroed cache entries are stale */
+static uint64_t __mpiprof_type_generation = 1;
+
+/* Ticks are calibrated against the clock over the whole run */
+static uint64_t __mpiprof_tick0;
+static double   __mpiprof_ns0;
+
+static inline uint64_t mpiprof_ticks(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+	return __rdtsc();
+#else
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+#endif
+}
+
+static double mpiprof_ns(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+__attribute__((constructor)) static void mpiprof_start(void)
+{
+	__mpiprof_tick0 = mpiprof_ticks();
+	__mpiprof_ns0   = mpiprof_ns();
+
+	if(getenv("MPIPROF_DISABLE") )
+	{
+		__mpiprof_enabled = 0;
+	}
+}
+
+static int mpiprof_register(struct mpiprof_fn *fn)
+{
+	int id       = __atomic_fetch_add(&__mpiprof_fn_count, 1, __ATOMIC_RELAXED);
+	int expected = -1;
+
+	if(MPIPROF_MAX_FUNCTIONS <= id)
+	{
+		/* Out of slots, never counted */
+		id = MPIPROF_MAX_FUNCTIONS;
+	}
+
+	if(!__atomic_compare_exchange_n(&fn->id, &expected, id, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+	{
+		/* Registered by another thread, our slot stays empty */
+		return expected;
+	}
+
+	if(id < MPIPROF_MAX_FUNCTIONS)
+	{
+		__atomic_store_n(&__mpiprof_fns[id], fn, __ATOMIC_RELEASE);
+	}
+
+	return id;
+}
+
+static struct mpiprof_thread *mpiprof_thread_register(void)
+{
+	struct mpiprof_thread *thread = calloc(1, sizeof(struct mpiprof_thread) );
+
+	if(!thread)
+	{
+		return NULL;
+	}
+
+	thread->next = __atomic_load_n(&__mpiprof_threads, __ATOMIC_RELAXED);
+
+	while(!__atomic_compare_exchange_n(&__mpiprof_threads, &thread->next, thread, 1, __ATOMIC_RELEASE, __ATOMIC_RELAXED) )
+	{
+	}
+
+	__mpiprof_self = thread;
+	return thread;
+}
+
+/* NULL when the call is not to be recorded */
+static inline struct mpiprof_counter *mpiprof_counter(struct mpiprof_fn *fn)
+{
+	struct mpiprof_thread *thread = __mpiprof_self;
+	int id;
+
+	if(__builtin_expect(!__atomic_load_n(&__mpiprof_enabled, __ATOMIC_RELAXED), 0) )
+	{
+		return NULL;
+	}
+
+	id = __atomic_load_n(&fn->id, __ATOMIC_ACQUIRE);
+
+	if(__builtin_expect(id < 0, 0) )
+	{
+		id = mpiprof_register(fn);
+	}
+
+	if(__builtin_expect(MPIPROF_MAX_FUNCTIONS <= id, 0) )
+	{
+		return NULL;
+	}
+
+	if(__builtin_expect(!thread, 0) )
+	{
+		if(!(thread = mpiprof_thread_register() ) )
+		{
+			return NULL;
+		}
+	}
+
+	return &thread->counters[id];
+}
+
+static inline void mpiprof_record(struct mpiprof_counter *counter, uint64_t start)
+{
+	uint64_t ticks = mpiprof_ticks() - start;
+
+	counter->calls++;
+	counter->ticks += ticks;
+
+	if(counter->max_ticks < ticks)
+	{
+		counter->max_ticks = ticks;
+	}
+}
+
+static inline uint64_t mpiprof_type_size(MPI_Datatype datatype)
+{
+	struct mpiprof_type *entry;
+	uint64_t generation = __atomic_load_n(&__mpiprof_type_generation, __ATOMIC_ACQUIRE);
+	uint64_t bits       = 0;
+	@TYPE_SIZE_T@ size = 0;
+
+	/* Handles are integers or pointers depending on the runtime */
+	memcpy(&bits, &datatype, sizeof(datatype) < sizeof(bits) ? sizeof(datatype) : sizeof(bits) );
+	bits ^= bits >> 17;
+	entry = &__mpiprof_self->types[(bits ^ (bits >> 7) ) & (MPIPROF_TYPE_CACHE - 1)];
+
+	if(__builtin_expect( (entry->generation == generation) && (entry->datatype == datatype), 1) )
+	{
+		return entry->size;
+	}
+
+	PMPI_Type_size(datatype, &size);
+
+	entry->datatype   = datatype;
+	entry->generation = generation;
+	entry->size       = size;
+	return size;
+}
+
+/* Only called with a counter, hence a thread */
+static inline void mpiprof_message(struct mpiprof_counter *counter, const void *buf, MPI_Count count, MPI_Datatype datatype)
+{
+	uint64_t bytes;
+	int      bucket;
+
+	if( (buf == MPI_IN_PLACE) || (datatype == MPI_DATATYPE_NULL) )
+	{
+		return;
+	}
+
+	bytes  = (count <= 0) ? 0 : (uint64_t)count * mpiprof_type_size(datatype);
+	bucket = bytes ? 64 - __builtin_clzll(bytes) : 0;
+
+	if(MPIPROF_SIZE_BUCKETS <= bucket)
+	{
+		bucket = MPIPROF_SIZE_BUCKETS - 1;
+	}
+
+	counter->bytes += bytes;
+	counter->sizes[bucket]++;
+}
+
+/* Sum of the counters of all the threads */
+static void mpiprof_total(int id, struct mpiprof_counter *total)
+{
+	struct mpiprof_thread *thread;
+	int bucket;
+
+	memset(total, 0, sizeof(*total) );
+
+	for(thread = __atomic_load_n(&__mpiprof_threads, __ATOMIC_ACQUIRE); thread; thread = thread->next)
+	{
+		struct mpiprof_counter *counter = &thread->counters[id];
+
+		total->calls += counter->calls;
+		total->ticks += counter->ticks;
+		total->bytes += counter->bytes;
+
+		if(total->max_ticks < counter->max_ticks)
+		{
+			total->max_ticks = counter->max_ticks;
+		}
+
+		for(bucket = 0; bucket < MPIPROF_SIZE_BUCKETS; bucket++)
+		{
+			total->sizes[bucket] += counter->sizes[bucket];
+		}
+	}
+}
+
+/* One file per rank, MPIPROF_OUTPUT.<rank>.txt */
+static void mpiprof_dump(void)
+{
+	const char *prefix = getenv("MPIPROF_OUTPUT");
+	double      ns     = mpiprof_ns() - __mpiprof_ns0;
+	double      ticks_per_s;
+	char        path[4096];
+	FILE *      out;
+	int         rank = 0;
+	int         count, id, bucket;
+	struct mpiprof_counter total;
+
+	ticks_per_s = (ns > 0) ? (mpiprof_ticks() - __mpiprof_tick0) * 1e9 / ns : 1e9;
+
+	PMPI_Comm_rank(MPI_COMM_WORLD, &rank);
+	snprintf(path, sizeof(path), "%s.%d.txt", prefix ? prefix : "mpiprof", rank);
+
+	if(!(out = fopen(path, "w") ) )
+	{
+		return;
+	}
+
+	count = __atomic_load_n(&__mpiprof_fn_count, __ATOMIC_ACQUIRE);
+
+	if(MPIPROF_MAX_FUNCTIONS < count)
+	{
+		count = MPIPROF_MAX_FUNCTIONS;
+	}
+
+	fprintf(out, "# function calls total_s max_s bytes\\n");
+
+	for(id = 0; id < count; id++)
+	{
+		struct mpiprof_fn *fn = __atomic_load_n(&__mpiprof_fns[id], __ATOMIC_ACQUIRE);
+
+		if(!fn)
+		{
+			continue;
+		}
+
+		mpiprof_total(id, &total);
+
+		if(total.calls)
+		{
+			fprintf(out, "%s %llu %.9f %.9f %llu\\n", fn->name,
+			        (unsigned long long)total.calls,
+			        total.ticks / ticks_per_s,
+			        total.max_ticks / ticks_per_s,
+			        (unsigned long long)total.bytes);
+		}
+	}
+
+	/* Messages of [min_bytes, 2 * min_bytes) bytes */
+	fprintf(out, "# function min_bytes messages\\n");
+
+	for(id = 0; id < count; id++)
+	{
+		struct mpiprof_fn *fn = __atomic_load_n(&__mpiprof_fns[id], __ATOMIC_ACQUIRE);
+
+		if(!fn)
+		{
+			continue;
+		}
+
+		mpiprof_total(id, &total);
+
+		for(bucket = 0; bucket < MPIPROF_SIZE_BUCKETS; bucket++)
+		{
+			if(total.sizes[bucket])
+			{
+				fprintf(out, "%s %llu %llu\\n", fn->name,
+				        bucket ? 1ull << (bucket - 1) : 0ull,
+				        (unsigned long long)total.sizes[bucket]);
+			}
+		}
+	}
+
+	fclose(out);
+}
+"""
+
+
+def gen_prelude(meta):
+    # PMPI_Type_size reports through the same type as the generated header
+    return PRELUDE.replace("@TYPE_SIZE_T@", meta.kind_expand("POLYNUM_BYTES"))
+
+
+def gen_prof_wrapper(f):
+    if f.name() == "MPI_Pcontrol":
+        body = "__atomic_store_n(&__mpiprof_enabled, {} != 0, __ATOMIC_RELAXED);\n".format(f.params()[0].name())
+        return gen_pcontrol(f, body)
+
+    name = f.meta.fname(f.name())
+    desc = "__mpiprof_fn_{}".format(name)
+
+    before = "struct mpiprof_counter *__mpiprof_cnt = mpiprof_counter(&{});\n".format(desc)
+    if f.name() == "MPI_Finalize":
+        # Dump while MPI is still usable
+        before += "mpiprof_dump();\n"
+    elif f.name() == "MPI_Type_free":
+        # Before the handle can be reused
+        before += "__atomic_fetch_add(&__mpiprof_type_generation, 1, __ATOMIC_RELEASE);\n"
+    before += "uint64_t __mpiprof_start = mpiprof_ticks();\n"
+
+    after = "if(__mpiprof_cnt)\n{\n"
+    after += "\tmpiprof_record(__mpiprof_cnt, __mpiprof_start);\n"
+    if f.number_of_buffer_params():
+        for buf, count, datatype in f.buffer_triplets():
+            after += "\tmpiprof_message(__mpiprof_cnt, {}, {}, {});\n".format(
+                buf.name(), count.name(), datatype.name())
+    after += "}\n"
+
+    decl = "static struct mpiprof_fn {} = {{\"{}\", -1}};\n\n".format(desc, name)
+    return gen_wrapper(f, before, after, decl)
+
+
+def is_part_of_bindings(f):
+    return is_interposable(f) or f.name() == "MPI_Pcontrol"
+
+
+def backend(args):
+    # Same signatures as the header, large counts are the _c functions
+    meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+    return MPI_Backend("prof", meta, is_part_of_bindings, gen_prof_wrapper, prelude=gen_prelude(meta),
+                       large_count=meta.large_count())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI PMPI profiling library generation tool')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
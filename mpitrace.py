@@ -0,0 +1,553 @@
+from mpiiface import MPI_Interface, MPI_Standard_meta
+from mpigen import MPI_Backend, MPI_Output_sink, add_common_arguments, add_output_argument, generate
+from mpiinterpose import is_interposable, gen_wrapper, gen_pcontrol
+import argparse
+import heapq
+import struct
+import sys
+
+
+PRELUDE = """#include <mpi.h>
+#include <pthread.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+	#include <x86intrin.h>
+#endif
+
+/* Bytes per thread, must be a power of two */
+#ifndef MPITRACE_RING_SIZE
+	#define MPITRACE_RING_SIZE (1 << 22)
+#endif
+
+#ifndef MPITRACE_MAX_FUNCTIONS
+	#define MPITRACE_MAX_FUNCTIONS 4096
+#endif
+
+/* Period of the flusher thread */
+#ifndef MPITRACE_FLUSH_US
+	#define MPITRACE_FLUSH_US 1000
+#endif
+
+#define MPITRACE_ENTER    0
+#define MPITRACE_EXIT     1
+
+/* ticks (u64), function id (u16), type (u8), argument bytes (u8) */
+#define MPITRACE_HEAD     12
+#define MPITRACE_VERSION  1
+
+struct mpitrace_fn
+{
+	const char *name;
+	int         id;
+};
+
+/* Written by its thread (head) and by the flusher (tail) only */
+struct mpitrace_ring
+{
+	uint64_t              head;
+	uint64_t              dropped;
+	uint64_t              tail __attribute__( (aligned(64) ) );
+	uint32_t              thread;
+	struct mpitrace_ring *next;
+	uint8_t               data[MPITRACE_RING_SIZE] __attribute__( (aligned(64) ) );
+};
+
+/* Functions get an id on their first call */
+static struct mpitrace_fn *__mpitrace_fns[MPITRACE_MAX_FUNCTIONS];
+static int __mpitrace_fn_count = 0;
+
+static struct mpitrace_ring *__mpitrace_rings = NULL;
+static __thread struct mpitrace_ring *__mpitrace_self = NULL;
+static uint32_t __mpitrace_thread_count = 0;
+
+/* Toggled by MPI_Pcontrol, cleared once the trace is closed */
+static int __mpitrace_enabled = 1;
+
+static FILE *     __mpitrace_out = NULL;
+static pthread_t  __mpitrace_flusher;
+static int        __mpitrace_flusher_running = 0;
+static int        __mpitrace_stop = 0;
+
+/* Ticks are calibrated against the clock over the whole run */
+static uint64_t __mpitrace_tick0;
+static double   __mpitrace_ns0;
+
+static inline uint64_t mpitrace_ticks(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+	return __rdtsc();
+#else
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+#endif
+}
+
+static double mpitrace_ns(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+__attribute__((constructor)) static void mpitrace_start(void)
+{
+	__mpitrace_tick0 = mpitrace_ticks();
+	__mpitrace_ns0   = mpitrace_ns();
+
+	if(getenv("MPITRACE_DISABLE") )
+	{
+		__mpitrace_enabled = 0;
+	}
+}
+
+static int mpitrace_register(struct mpitrace_fn *fn)
+{
+	int id       = __atomic_fetch_add(&__mpitrace_fn_count, 1, __ATOMIC_RELAXED);
+	int expected = -1;
+
+	if(MPITRACE_MAX_FUNCTIONS <= id)
+	{
+		/* Out of slots, never traced */
+		id = MPITRACE_MAX_FUNCTIONS;
+	}
+
+	if(!__atomic_compare_exchange_n(&fn->id, &expected, id, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+	{
+		/* Registered by another thread, our slot stays empty */
+		return expected;
+	}
+
+	if(id < MPITRACE_MAX_FUNCTIONS)
+	{
+		__atomic_store_n(&__mpitrace_fns[id], fn, __ATOMIC_RELEASE);
+	}
+
+	return id;
+}
+
+static struct mpitrace_ring *mpitrace_ring_register(void)
+{
+	struct mpitrace_ring *ring = NULL;
+
+	if(posix_memalign( (void **)&ring, 64, sizeof(struct mpitrace_ring) ) )
+	{
+		return NULL;
+	}
+
+	ring->head    = 0;
+	ring->dropped = 0;
+	ring->tail    = 0;
+	ring->thread  = __atomic_fetch_add(&__mpitrace_thread_count, 1, __ATOMIC_RELAXED);
+	ring->next    = __atomic_load_n(&__mpitrace_rings, __ATOMIC_RELAXED);
+
+	while(!__atomic_compare_exchange_n(&__mpitrace_rings, &ring->next, ring, 1, __ATOMIC_RELEASE, __ATOMIC_RELAXED) )
+	{
+	}
+
+	__mpitrace_self = ring;
+	return ring;
+}
+
+static inline void mpitrace_copy(struct mpitrace_ring *ring, uint64_t pos, const void *src, size_t len)
+{
+	size_t off   = pos & (MPITRACE_RING_SIZE - 1);
+	size_t first = MPITRACE_RING_SIZE - off;
+
+	if(len <= first)
+	{
+		memcpy(ring->data + off, src, len);
+	}
+	else
+	{
+		memcpy(ring->data + off, src, first);
+		memcpy(ring->data, (const uint8_t *)src + first, len - first);
+	}
+}
+
+static inline void mpitrace_i32(uint8_t *dest, int32_t value)
+{
+	memcpy(dest, &value, sizeof(value) );
+}
+
+static inline void mpitrace_i64(uint8_t *dest, int64_t value)
+{
+	memcpy(dest, &value, sizeof(value) );
+}
+
+/* Never blocks, events are dropped when the ring is full */
+static inline void mpitrace_event(struct mpitrace_fn *fn, uint8_t type, const uint8_t *args, uint8_t size)
+{
+	struct mpitrace_ring *ring = __mpitrace_self;
+	uint8_t  head[MPITRACE_HEAD];
+	uint64_t ticks;
+	uint64_t pos;
+	uint16_t fid;
+	int id;
+
+	if(__builtin_expect(!__atomic_load_n(&__mpitrace_enabled, __ATOMIC_RELAXED), 0) )
+	{
+		return;
+	}
+
+	id = __atomic_load_n(&fn->id, __ATOMIC_ACQUIRE);
+
+	if(__builtin_expect(id < 0, 0) )
+	{
+		id = mpitrace_register(fn);
+	}
+
+	if(__builtin_expect(MPITRACE_MAX_FUNCTIONS <= id, 0) )
+	{
+		return;
+	}
+
+	if(__builtin_expect(!ring, 0) )
+	{
+		if(!(ring = mpitrace_ring_register() ) )
+		{
+			return;
+		}
+	}
+
+	pos = ring->head;
+
+	if(__builtin_expect(MPITRACE_RING_SIZE < pos + MPITRACE_HEAD + size - __atomic_load_n(&ring->tail, __ATOMIC_ACQUIRE), 0) )
+	{
+		__atomic_store_n(&ring->dropped, ring->dropped + 1, __ATOMIC_RELAXED);
+		return;
+	}
+
+	/* Disabled and dropped events do not pay the clock */
+	ticks = mpitrace_ticks();
+	fid   = id;
+	memcpy(head, &ticks, sizeof(ticks) );
+	memcpy(head + 8, &fid, sizeof(fid) );
+	head[10] = type;
+	head[11] = size;
+
+	mpitrace_copy(ring, pos, head, MPITRACE_HEAD);
+	mpitrace_copy(ring, pos + MPITRACE_HEAD, args, size);
+
+	/* Publish the whole event to the flusher */
+	__atomic_store_n(&ring->head, pos + MPITRACE_HEAD + size, __ATOMIC_RELEASE);
+}
+
+/* Blocks of (thread, bytes) followed by the events of that thread */
+static void mpitrace_drain(void)
+{
+	struct mpitrace_ring *ring;
+
+	for(ring = __atomic_load_n(&__mpitrace_rings, __ATOMIC_ACQUIRE); ring; ring = ring->next)
+	{
+		uint64_t tail = ring->tail;
+		uint64_t head = __atomic_load_n(&ring->head, __ATOMIC_ACQUIRE);
+		uint32_t block[2];
+		size_t   off, first;
+
+		if(head == tail)
+		{
+			continue;
+		}
+
+		block[0] = ring->thread;
+		block[1] = head - tail;
+		off      = tail & (MPITRACE_RING_SIZE - 1);
+		first    = MPITRACE_RING_SIZE - off;
+
+		if(block[1] < first)
+		{
+			first = block[1];
+		}
+
+		fwrite(block, sizeof(block), 1, __mpitrace_out);
+		fwrite(ring->data + off, 1, first, __mpitrace_out);
+		fwrite(ring->data, 1, block[1] - first, __mpitrace_out);
+
+		/* Hand the space back to the thread */
+		__atomic_store_n(&ring->tail, head, __ATOMIC_RELEASE);
+	}
+}
+
+static void *mpitrace_flush_loop(void *arg)
+{
+	struct timespec period = { MPITRACE_FLUSH_US / 1000000, (MPITRACE_FLUSH_US % 1000000) * 1000 };
+
+	while(!__atomic_load_n(&__mpitrace_stop, __ATOMIC_ACQUIRE) )
+	{
+		nanosleep(&period, NULL);
+		mpitrace_drain();
+	}
+
+	return NULL;
+}
+
+/* One file per rank, MPITRACE_OUTPUT.<rank>.bin */
+static void mpitrace_open(void)
+{
+	const char *prefix = getenv("MPITRACE_OUTPUT");
+	char        path[4096];
+	uint32_t    header[2];
+	int         rank = 0;
+
+	if(__mpitrace_out)
+	{
+		return;
+	}
+
+	PMPI_Comm_rank(MPI_COMM_WORLD, &rank);
+	snprintf(path, sizeof(path), "%s.%d.bin", prefix ? prefix : "mpitrace", rank);
+
+	if(!(__mpitrace_out = fopen(path, "wb") ) )
+	{
+		return;
+	}
+
+	header[0] = MPITRACE_VERSION;
+	header[1] = rank;
+	fwrite("MPITRACE", 8, 1, __mpitrace_out);
+	fwrite(header, sizeof(header), 1, __mpitrace_out);
+
+	/* Without the flusher the rings are only written when closing */
+	__mpitrace_flusher_running = !pthread_create(&__mpitrace_flusher, NULL, mpitrace_flush_loop, NULL);
+}
+
+static void mpitrace_close(void)
+{
+	struct mpitrace_ring *ring;
+	double   ns = mpitrace_ns() - __mpitrace_ns0;
+	double   ticks_per_s;
+	uint64_t footer;
+	uint32_t count, threads = 0;
+	uint32_t id;
+
+	if(!__mpitrace_out)
+	{
+		return;
+	}
+
+	ticks_per_s = (ns > 0) ? (mpitrace_ticks() - __mpitrace_tick0) * 1e9 / ns : 1e9;
+
+	__atomic_store_n(&__mpitrace_stop, 1, __ATOMIC_RELEASE);
+
+	if(__mpitrace_flusher_running)
+	{
+		pthread_join(__mpitrace_flusher, NULL);
+	}
+
+	mpitrace_drain();
+	__atomic_store_n(&__mpitrace_enabled, 0, __ATOMIC_RELAXED);
+
+	/* Footer: calibration, function names and dropped events */
+	footer = ftell(__mpitrace_out);
+	fwrite(&ticks_per_s, sizeof(ticks_per_s), 1, __mpitrace_out);
+	fwrite(&__mpitrace_tick0, sizeof(__mpitrace_tick0), 1, __mpitrace_out);
+
+	count = __atomic_load_n(&__mpitrace_fn_count, __ATOMIC_ACQUIRE);
+
+	if(MPITRACE_MAX_FUNCTIONS < count)
+	{
+		count = MPITRACE_MAX_FUNCTIONS;
+	}
+
+	fwrite(&count, sizeof(count), 1, __mpitrace_out);
+
+	for(id = 0; id < count; id++)
+	{
+		struct mpitrace_fn *fn  = __atomic_load_n(&__mpitrace_fns[id], __ATOMIC_ACQUIRE);
+		uint16_t            len = fn ? strlen(fn->name) : 0;
+
+		fwrite(&len, sizeof(len), 1, __mpitrace_out);
+		fwrite(fn ? fn->name : "", 1, len, __mpitrace_out);
+	}
+
+	for(ring = __atomic_load_n(&__mpitrace_rings, __ATOMIC_ACQUIRE); ring; ring = ring->next)
+	{
+		threads++;
+	}
+
+	fwrite(&threads, sizeof(threads), 1, __mpitrace_out);
+
+	for(ring = __atomic_load_n(&__mpitrace_rings, __ATOMIC_ACQUIRE); ring; ring = ring->next)
+	{
+		uint64_t dropped = __atomic_load_n(&ring->dropped, __ATOMIC_RELAXED);
+
+		fwrite(&ring->thread, sizeof(ring->thread), 1, __mpitrace_out);
+		fwrite(&dropped, sizeof(dropped), 1, __mpitrace_out);
+	}
+
+	fwrite(&footer, sizeof(footer), 1, __mpitrace_out);
+	fwrite("MPITREND", 8, 1, __mpitrace_out);
+	fclose(__mpitrace_out);
+	__mpitrace_out = NULL;
+}
+"""
+
+# Scalar arguments recorded on entry: struct format and C value
+TRACE_KINDS = {
+    "RANK": ("i", "{}"),
+    "TAG": ("i", "{}"),
+    "COMMUNICATOR": ("i", "PMPI_Comm_c2f({})"),
+    "POLYXFER_NUM_ELEM": ("q", "{}"),
+    "POLYXFER_NUM_ELEM_NNI": ("q", "{}"),
+}
+
+TRACE_STORE = {"i": "mpitrace_i32", "q": "mpitrace_i64"}
+
+# ticks, function id, event type, argument bytes
+HEAD = "QHBB"
+ENTER = 0
+EXIT = 1
+
+
+def traced_params(f):
+    """(parameter, struct format) of the arguments recorded on entry"""
+    ret = []
+    for p in f.parameters:
+        if p.kind() not in TRACE_KINDS:
+            continue
+        if p.length() is not None or p.isout() or p.type_c_is_pointer():
+            continue
+        ret.append((p, TRACE_KINDS[p.kind()][0]))
+    return ret
+
+
+def gen_trace_wrapper(f):
+    if f.name() == "MPI_Pcontrol":
+        body = "__atomic_store_n(&__mpitrace_enabled, {} != 0, __ATOMIC_RELAXED);\n".format(f.params()[0].name())
+        return gen_pcontrol(f, body)
+
+    name = f.meta.fname(f.name())
+    desc = "__mpitrace_fn_{}".format(name)
+    params = traced_params(f)
+    size = struct.calcsize("<" + "".join(fmt for _, fmt in params))
+
+    before = ""
+    if params:
+        before += "uint8_t __mpitrace_args[{}];\n".format(size)
+        offset = 0
+        for p, fmt in params:
+            value = TRACE_KINDS[p.kind()][1].format(p.name())
+            before += "{}(__mpitrace_args + {}, {});\n".format(TRACE_STORE[fmt], offset, value)
+            offset += struct.calcsize("<" + fmt)
+        before += "mpitrace_event(&{}, MPITRACE_ENTER, __mpitrace_args, {});\n".format(desc, size)
+    else:
+        before += "mpitrace_event(&{}, MPITRACE_ENTER, NULL, 0);\n".format(desc)
+
+    if f.name() == "MPI_Finalize":
+        # Flush while MPI is still usable
+        before += "mpitrace_close();\n"
+
+    after = ""
+    if f.name() in ("MPI_Init", "MPI_Init_thread"):
+        # The rank names the file
+        after += "mpitrace_open();\n"
+    after += "mpitrace_event(&{}, MPITRACE_EXIT, NULL, 0);\n".format(desc)
+
+    decl = "static struct mpitrace_fn {} = {{\"{}\", -1}};\n\n".format(desc, name)
+    return gen_wrapper(f, before, after, decl)
+
+
+def is_part_of_bindings(f):
+    return is_interposable(f) or f.name() == "MPI_Pcontrol"
+
+
+def backend(args):
+    # Same signatures as the header, large counts are the _c functions
+    meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+    return MPI_Backend("trace", meta, is_part_of_bindings, gen_trace_wrapper, prelude=PRELUDE,
+                       large_count=meta.large_count())
+
+
+def read_trace(path, iface):
+    """Decode a trace file, arguments are named after the interface parameters"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data[:8] != b"MPITRACE" or data[-8:] != b"MPITREND":
+        raise Exception("{} is not a complete trace".format(path))
+
+    # Written in the byte order of the traced machine
+    order = "<" if struct.unpack_from("<I", data, 8)[0] == 1 else ">"
+    version, rank = struct.unpack_from(order + "II", data, 8)
+    if version != 1:
+        raise Exception("Unsupported trace version {}".format(version))
+
+    head = struct.Struct(order + HEAD)
+    footer, = struct.unpack_from(order + "Q", data, len(data) - 16)
+    ticks_per_s, tick0, count = struct.unpack_from(order + "dQI", data, footer)
+    offset = footer + 20
+
+    functions = []
+    for _ in range(count):
+        length, = struct.unpack_from(order + "H", data, offset)
+        name = data[offset + 2:offset + 2 + length].decode()
+        offset += 2 + length
+        # Large count (_c) functions record the arguments of their record
+        record = name[:-2] if name.endswith("_c") and name not in iface.functions else name
+        if name and record not in iface.functions:
+            raise Exception("{} is not in the interface".format(name))
+        if name:
+            params = traced_params(iface.functions[record])
+            layout = struct.Struct(order + "".join(fmt for _, fmt in params))
+            functions.append((name, [p.name() for p, _ in params], layout))
+        else:
+            functions.append(None)
+
+    threads, = struct.unpack_from(order + "I", data, offset)
+    dropped = {}
+    for i in range(threads):
+        thread, n = struct.unpack_from(order + "IQ", data, offset + 4 + i * 12)
+        dropped[thread] = n
+
+    # Events of each thread are split in blocks
+    streams = {}
+    offset = 16
+    while offset < footer:
+        thread, size = struct.unpack_from(order + "II", data, offset)
+        streams.setdefault(thread, []).append(data[offset + 8:offset + 8 + size])
+        offset += 8 + size
+
+    def events(thread, stream):
+        pos = 0
+        while pos < len(stream):
+            ticks, fid, kind, size = head.unpack_from(stream, pos)
+            name, names, layout = functions[fid]
+            if size != layout.size and kind == ENTER:
+                raise Exception("Event size mismatch for {}".format(name))
+            args = dict(zip(names, layout.unpack_from(stream, pos + head.size))) if kind == ENTER else {}
+            yield ((ticks - tick0) / ticks_per_s, thread, name, "enter" if kind == ENTER else "exit", args)
+            pos += head.size + size
+
+    merged = heapq.merge(*[events(t, b"".join(s)) for t, s in sorted(streams.items())], key=lambda e: e[0])
+
+    return {"rank": rank, "dropped": dropped, "events": list(merged)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI PMPI tracing library generation tool')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    parser.add_argument('--read', metavar="TRACE", type=str, help='Decode this trace file instead of generating the library')
+    args = parser.parse_args()
+
+    if args.read:
+        meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+        trace = read_trace(args.read, MPI_Interface(args.datafile, meta, cache_dir=args.model_cache))
+        with MPI_Output_sink(args.output or sys.stdout) as out:
+            out.write("# rank {}\n".format(trace["rank"]))
+            for thread, n in sorted(trace["dropped"].items()):
+                if n:
+                    out.write("# thread {} dropped {} events\n".format(thread, n))
+            for time, thread, name, kind, params in trace["events"]:
+                out.write("{:.9f} {} {} {}{}\n".format(time, thread, kind, name,
+                          "".join(" {}={}".format(k, v) for k, v in params.items())))
+    else:
+        generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)
@@ -0,0 +1,608 @@
+from mpiiface import MPI_Standard_meta
+from mpigen import MPI_Backend, add_common_arguments, add_output_argument, generate
+from mpiinterpose import is_interposable, gen_wrapper, gen_pcontrol
+import argparse
+import sys
+
+
+PRELUDE = """#include <mpi.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+/* Entries per table, must be a power of two */
+#ifndef MPITRAFFIC_SLOTS
+	#define MPITRAFFIC_SLOTS (1 << 16)
+#endif
+
+/* Slots looked at before giving up on a key */
+#ifndef MPITRAFFIC_PROBES
+	#define MPITRAFFIC_PROBES 32
+#endif
+
+#define MPITRAFFIC_USED (1ull << 63)
+
+struct mpitraffic_fn
+{
+	const char *name;
+	int         id;
+};
+
+/* Keys are only set once, counters are updated atomically */
+struct mpitraffic_entry
+{
+	uint64_t    key;
+	uint64_t    messages;
+	uint64_t    bytes;
+	const char *name;
+	int         peer;
+};
+
+struct mpitraffic_table
+{
+	struct mpitraffic_entry entries[MPITRAFFIC_SLOTS];
+	uint64_t                dropped;
+};
+
+/* (communicator id, destination) of the point to point messages */
+static struct mpitraffic_table __mpitraffic_p2p;
+/* (collective, communicator id) of the collective calls */
+static struct mpitraffic_table __mpitraffic_coll;
+
+static int __mpitraffic_fn_count = 0;
+
+/* Communicators are numbered by an attribute so that a freed one takes
+ * its id along (handles are reused), 0 is MPI_COMM_WORLD */
+static int __mpitraffic_keyval = MPI_KEYVAL_INVALID;
+static int __mpitraffic_comm_count = 1;
+
+/* Toggled by MPI_Pcontrol */
+static int __mpitraffic_enabled = 1;
+
+__attribute__((constructor)) static void mpitraffic_start(void)
+{
+	if(getenv("MPITRAFFIC_DISABLE") )
+	{
+		__mpitraffic_enabled = 0;
+	}
+}
+
+static inline uint64_t mpitraffic_hash(uint64_t key)
+{
+	key ^= key >> 33;
+	key *= 0xff51afd7ed558ccdull;
+	key ^= key >> 33;
+	return key;
+}
+
+/* NULL when all the probed slots hold other keys */
+static inline struct mpitraffic_entry *mpitraffic_slot(struct mpitraffic_table *table, uint64_t key, int *inserted)
+{
+	uint64_t hash = mpitraffic_hash(key);
+	int      i;
+
+	for(i = 0; i < MPITRAFFIC_PROBES; i++)
+	{
+		struct mpitraffic_entry *entry = &table->entries[(hash + i) & (MPITRAFFIC_SLOTS - 1)];
+		uint64_t cur = __atomic_load_n(&entry->key, __ATOMIC_ACQUIRE);
+
+		if(__builtin_expect(cur == key, 1) )
+		{
+			return entry;
+		}
+
+		if(!cur)
+		{
+			if(__atomic_compare_exchange_n(&entry->key, &cur, key, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+			{
+				*inserted = 1;
+				return entry;
+			}
+
+			/* Claimed by another thread in the meantime */
+			if(cur == key)
+			{
+				return entry;
+			}
+		}
+	}
+
+	__atomic_fetch_add(&table->dropped, 1, __ATOMIC_RELAXED);
+	return NULL;
+}
+
+static inline int mpitraffic_keyval(void)
+{
+	int keyval = __atomic_load_n(&__mpitraffic_keyval, __ATOMIC_ACQUIRE);
+
+	if(__builtin_expect(keyval == MPI_KEYVAL_INVALID, 0) )
+	{
+		int expected = MPI_KEYVAL_INVALID;
+
+		/* Not copied, duplicates get their own id */
+		PMPI_Comm_create_keyval(MPI_COMM_NULL_COPY_FN, MPI_COMM_NULL_DELETE_FN, &keyval, NULL);
+
+		if(!__atomic_compare_exchange_n(&__mpitraffic_keyval, &expected, keyval, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+		{
+			PMPI_Comm_free_keyval(&keyval);
+			keyval = expected;
+		}
+	}
+
+	return keyval;
+}
+
+static inline uint32_t mpitraffic_comm_id(MPI_Comm comm)
+{
+	void *value = NULL;
+	int   flag  = 0;
+	int   keyval;
+	int   id;
+
+	if(comm == MPI_COMM_WORLD)
+	{
+		return 0;
+	}
+
+	keyval = mpitraffic_keyval();
+	PMPI_Comm_get_attr(comm, keyval, &value, &flag);
+
+	if(flag)
+	{
+		return (uint32_t)(uintptr_t)value;
+	}
+
+	id = __atomic_fetch_add(&__mpitraffic_comm_count, 1, __ATOMIC_RELAXED);
+	PMPI_Comm_set_attr(comm, keyval, (void *)(uintptr_t)id);
+	return id;
+}
+
+/* MPI_COMM_WORLD rank of a rank of comm (of its remote group for an
+ * intercommunicator), MPI_UNDEFINED for spawned processes */
+static int mpitraffic_world_rank(MPI_Comm comm, int rank)
+{
+	MPI_Group group;
+	MPI_Group world;
+	int       inter = 0;
+	int       ret   = MPI_UNDEFINED;
+
+	if(comm == MPI_COMM_WORLD)
+	{
+		return rank;
+	}
+
+	PMPI_Comm_test_inter(comm, &inter);
+
+	if(inter)
+	{
+		PMPI_Comm_remote_group(comm, &group);
+	}
+	else
+	{
+		PMPI_Comm_group(comm, &group);
+	}
+
+	PMPI_Comm_group(MPI_COMM_WORLD, &world);
+	PMPI_Group_translate_ranks(group, 1, &rank, world, &ret);
+	PMPI_Group_free(&group);
+	PMPI_Group_free(&world);
+	return ret;
+}
+
+static inline uint64_t mpitraffic_bytes(const void *buf, MPI_Count count, MPI_Datatype datatype)
+{
+	@TYPE_SIZE_T@ size = 0;
+
+	if( (buf == MPI_IN_PLACE) || (datatype == MPI_DATATYPE_NULL) || (count <= 0) )
+	{
+		return 0;
+	}
+
+	PMPI_Type_size(datatype, &size);
+	return (uint64_t)count * (uint64_t)size;
+}
+
+static inline void mpitraffic_p2p(MPI_Comm comm, int dest, uint64_t bytes)
+{
+	struct mpitraffic_entry *entry;
+	int inserted = 0;
+
+	if(__builtin_expect(!__atomic_load_n(&__mpitraffic_enabled, __ATOMIC_RELAXED), 0) || (dest == MPI_PROC_NULL) || (comm == MPI_COMM_NULL) )
+	{
+		return;
+	}
+
+	entry = mpitraffic_slot(&__mpitraffic_p2p, MPITRAFFIC_USED | ( (uint64_t)mpitraffic_comm_id(comm) << 32) | (uint32_t)dest, &inserted);
+
+	if(!entry)
+	{
+		return;
+	}
+
+	if(inserted)
+	{
+		/* Translated once per key, communicators may be gone when dumping */
+		__atomic_store_n(&entry->peer, mpitraffic_world_rank(comm, dest), __ATOMIC_RELAXED);
+	}
+
+	__atomic_fetch_add(&entry->messages, 1, __ATOMIC_RELAXED);
+	__atomic_fetch_add(&entry->bytes, bytes, __ATOMIC_RELAXED);
+}
+
+static inline void mpitraffic_coll(struct mpitraffic_fn *fn, MPI_Comm comm, uint64_t bytes)
+{
+	struct mpitraffic_entry *entry;
+	int inserted = 0;
+	int id;
+
+	if(__builtin_expect(!__atomic_load_n(&__mpitraffic_enabled, __ATOMIC_RELAXED), 0) || (comm == MPI_COMM_NULL) )
+	{
+		return;
+	}
+
+	id = __atomic_load_n(&fn->id, __ATOMIC_ACQUIRE);
+
+	if(__builtin_expect(id < 0, 0) )
+	{
+		int expected = -1;
+
+		id = __atomic_fetch_add(&__mpitraffic_fn_count, 1, __ATOMIC_RELAXED);
+
+		if(!__atomic_compare_exchange_n(&fn->id, &expected, id, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE) )
+		{
+			id = expected;
+		}
+	}
+
+	entry = mpitraffic_slot(&__mpitraffic_coll, MPITRAFFIC_USED | ( (uint64_t)id << 32) | mpitraffic_comm_id(comm), &inserted);
+
+	if(!entry)
+	{
+		return;
+	}
+
+	if(inserted)
+	{
+		__atomic_store_n(&entry->name, fn->name, __ATOMIC_RELAXED);
+	}
+
+	__atomic_fetch_add(&entry->messages, 1, __ATOMIC_RELAXED);
+	__atomic_fetch_add(&entry->bytes, bytes, __ATOMIC_RELAXED);
+}
+
+static inline int mpitraffic_recording(void)
+{
+	return __builtin_expect(__atomic_load_n(&__mpitraffic_enabled, __ATOMIC_RELAXED), 1);
+}
+
+/* Peers a collective sends to (out) and receives from (in), the
+ * neighbors of the topology for the neighborhood collectives */
+static inline void mpitraffic_peers(MPI_Comm comm, int neighbor, int *out, int *in)
+{
+	int size = 0;
+
+	if(!neighbor)
+	{
+		int inter = 0;
+
+		PMPI_Comm_test_inter(comm, &inter);
+
+		if(inter)
+		{
+			PMPI_Comm_remote_size(comm, &size);
+		}
+		else
+		{
+			PMPI_Comm_size(comm, &size);
+		}
+
+		*out = size;
+		*in  = size;
+		return;
+	}
+
+	int topo = MPI_UNDEFINED;
+
+	*out = 0;
+	*in  = 0;
+	PMPI_Topo_test(comm, &topo);
+
+	if(topo == MPI_CART)
+	{
+		PMPI_Cartdim_get(comm, &size);
+		*out = 2 * size;
+		*in  = 2 * size;
+	}
+	else if(topo == MPI_GRAPH)
+	{
+		int rank = 0;
+
+		PMPI_Comm_rank(comm, &rank);
+		PMPI_Graph_neighbors_count(comm, rank, &size);
+		*out = size;
+		*in  = size;
+	}
+	else if(topo == MPI_DIST_GRAPH)
+	{
+		int weighted = 0;
+
+		PMPI_Dist_graph_neighbors_count(comm, in, out, &weighted);
+	}
+}
+
+/* Root only arguments are not significant on the other ranks */
+static inline int mpitraffic_isroot(MPI_Comm comm, int root)
+{
+	int inter = 0;
+	int rank  = 0;
+
+	PMPI_Comm_test_inter(comm, &inter);
+
+	if(inter)
+	{
+		return root == MPI_ROOT;
+	}
+
+	PMPI_Comm_rank(comm, &rank);
+	return rank == root;
+}
+
+/* One file per rank, MPITRAFFIC_OUTPUT.<rank>.txt */
+static void mpitraffic_dump(void)
+{
+	const char *prefix = getenv("MPITRAFFIC_OUTPUT");
+	char        path[4096];
+	FILE *      out;
+	int         rank = 0;
+	int         i;
+
+	PMPI_Comm_rank(MPI_COMM_WORLD, &rank);
+	snprintf(path, sizeof(path), "%s.%d.txt", prefix ? prefix : "mpitraffic", rank);
+
+	if(!(out = fopen(path, "w") ) )
+	{
+		return;
+	}
+
+	fprintf(out, "# p2p comm dest messages bytes\\n");
+
+	for(i = 0; i < MPITRAFFIC_SLOTS; i++)
+	{
+		struct mpitraffic_entry *entry = &__mpitraffic_p2p.entries[i];
+		uint64_t key = __atomic_load_n(&entry->key, __ATOMIC_ACQUIRE);
+
+		if(key)
+		{
+			fprintf(out, "p2p %d %d %llu %llu\\n", (int)( (key >> 32) & 0x7fffffff), entry->peer,
+			        (unsigned long long)entry->messages, (unsigned long long)entry->bytes);
+		}
+	}
+
+	fprintf(out, "# coll function comm calls bytes\\n");
+
+	for(i = 0; i < MPITRAFFIC_SLOTS; i++)
+	{
+		struct mpitraffic_entry *entry = &__mpitraffic_coll.entries[i];
+		uint64_t key = __atomic_load_n(&entry->key, __ATOMIC_ACQUIRE);
+
+		if(key && entry->name)
+		{
+			fprintf(out, "coll %s %d %llu %llu\\n", entry->name, (int)(uint32_t)key,
+			        (unsigned long long)entry->messages, (unsigned long long)entry->bytes);
+		}
+	}
+
+	if(__mpitraffic_p2p.dropped || __mpitraffic_coll.dropped)
+	{
+		fprintf(out, "# dropped p2p %llu coll %llu\\n",
+		        (unsigned long long)__mpitraffic_p2p.dropped,
+		        (unsigned long long)__mpitraffic_coll.dropped);
+	}
+
+	fclose(out);
+}
+"""
+
+
+def gen_prelude(meta):
+    # PMPI_Type_size reports through the same type as the generated header
+    return PRELUDE.replace("@TYPE_SIZE_T@", meta.kind_expand("POLYNUM_BYTES"))
+
+
+def get_comm(f):
+    for p in f.parameters:
+        if p.kind() == "COMMUNICATOR" and p.length() is None and not p.isout():
+            return p
+    return None
+
+
+def outgoing_messages(f):
+    """(buffer, count, datatype, destination) of the messages sent by f"""
+    ret = []
+    params = f.parameters
+    for buf, count, datatype in f.buffer_triplets():
+        # Receive buffers are output only (MPI_Sendrecv_replace is inout)
+        if not buf.isin():
+            continue
+        for p in params[params.index(datatype) + 1:]:
+            if p.kind() == "RANK" and p.length() is None:
+                ret.append((buf, count, datatype, p))
+                break
+    return ret
+
+
+def iscollective(f):
+    # Scans only move data between ranks here, the bindings keep
+    # handling them as before
+    return f.iscollective() or "scan" in f.name().lower()
+
+
+def isp2p(f):
+    # Persistent requests would be counted once at init
+    return not iscollective(f) and \
+        not f.name().endswith("_init") and \
+        get_comm(f) is not None and \
+        len(outgoing_messages(f)) > 0
+
+
+def iscoll(f):
+    return iscollective(f) and \
+        not f.name().endswith("_init") and \
+        get_comm(f) is not None
+
+
+def gen_bytes(triplet):
+    buf, count, datatype = triplet[:3]
+    return "mpitraffic_bytes({}, {}, {})".format(buf.name(), count.name(), datatype.name())
+
+
+def coll_buffers(f):
+    """(buffer, count, datatype) of the collective f, counts and datatypes
+    may be arrays and a count following several buffers describes all of
+    them (sendbuf and recvbuf of MPI_Reduce)"""
+    ret = []
+    bufs = []
+    count = None
+    for p in f.parameters:
+        if p.kind() == "BUFFER":
+            if count:
+                bufs = []
+                count = None
+            bufs.append(p)
+        elif p.kind().startswith("POLYXFER_NUM_ELEM") and bufs:
+            count = p
+        elif p.kind() == "DATATYPE" and count:
+            ret += [(b, count, p) for b in bufs]
+            bufs = []
+            count = None
+    return ret
+
+
+def per_peer(f, buf):
+    # Scalar counts giving the block exchanged with each peer
+    name = f.name().lower()
+    if "alltoall" in name:
+        return True
+    if "reduce_scatter_block" in name:
+        return buf.constant()
+    if "reduce_scatter" in name:
+        return False
+    if "gather" in name:
+        return not buf.constant()
+    if "scatter" in name:
+        return buf.constant()
+    return False
+
+
+def gen_coll_volume(f, comm, desc):
+    """Block adding the bytes described by the buffers of the collective f"""
+    body = ""
+    decl = "uint64_t mpitraffic_volume = 0;\n"
+    peers = False
+    loop = False
+    rootonly = False
+
+    for buf, count, datatype in coll_buffers(f):
+        # Send buffers are constant, the others are received or updated
+        npeers = "mpitraffic_out" if buf.constant() else "mpitraffic_in"
+
+        if count.length() is not None and datatype.length() is not None:
+            peers = True
+            loop = True
+            term = "for(mpitraffic_i = 0; mpitraffic_i < {3}; mpitraffic_i++)\n" \
+                   "\tmpitraffic_volume += mpitraffic_bytes({0}, {1}[mpitraffic_i], {2}[mpitraffic_i]);\n".format(
+                       buf.name(), count.name(), datatype.name(), npeers)
+        elif count.length() is not None and "reduce_scatter" in f.name().lower() and not buf.constant():
+            # Each rank receives its own entry
+            term = "PMPI_Comm_rank({0}, &mpitraffic_rank);\n" \
+                   "mpitraffic_volume += mpitraffic_bytes({1}, {2}[mpitraffic_rank], {3});\n".format(
+                       comm.name(), buf.name(), count.name(), datatype.name())
+            decl += "int mpitraffic_rank = 0;\n"
+        elif count.length() is not None:
+            peers = True
+            loop = True
+            term = "mpitraffic_count = 0;\n" \
+                   "for(mpitraffic_i = 0; mpitraffic_i < {2}; mpitraffic_i++)\n" \
+                   "\tmpitraffic_count += {1}[mpitraffic_i];\n" \
+                   "mpitraffic_volume += mpitraffic_bytes({0}, mpitraffic_count, {3});\n".format(
+                       buf.name(), count.name(), npeers, datatype.name())
+            if "MPI_Count mpitraffic_count" not in decl:
+                decl += "MPI_Count mpitraffic_count = 0;\n"
+        elif per_peer(f, buf):
+            peers = True
+            term = "mpitraffic_volume += {} * {};\n".format(gen_bytes((buf, count, datatype)), npeers)
+        else:
+            term = "mpitraffic_volume += {};\n".format(gen_bytes((buf, count, datatype)))
+
+        if buf.isrootonly():
+            rootonly = True
+            term = "if(mpitraffic_root)\n{{\n{}}}\n".format(term)
+
+        body += term
+
+    if loop:
+        decl += "int mpitraffic_i = 0;\n"
+
+    if peers:
+        decl += "int mpitraffic_out = 0, mpitraffic_in = 0;\n"
+        decl += "mpitraffic_peers({}, {}, &mpitraffic_out, &mpitraffic_in);\n".format(
+            comm.name(), 1 if "neighbor" in f.name().lower() else 0)
+
+    if rootonly:
+        root = [p for p in f.parameters if p.kind() == "RANK" and p.length() is None][0]
+        decl += "int mpitraffic_root = mpitraffic_isroot({}, {});\n".format(comm.name(), root.name())
+
+    ret = "if(mpitraffic_recording() )\n{\n"
+    ret += decl + body
+    ret += "mpitraffic_coll(&{}, {}, mpitraffic_volume);\n".format(desc, comm.name())
+    ret += "}\n"
+    return ret
+
+
+def gen_traffic_wrapper(f):
+    if f.name() == "MPI_Pcontrol":
+        body = "__atomic_store_n(&__mpitraffic_enabled, {} != 0, __ATOMIC_RELAXED);\n".format(f.params()[0].name())
+        return gen_pcontrol(f, body)
+
+    comm = get_comm(f)
+    decl = ""
+    before = ""
+    after = ""
+
+    if f.name() == "MPI_Finalize":
+        # Dump while MPI is still usable
+        before += "mpitraffic_dump();\n"
+    elif isp2p(f):
+        for msg in outgoing_messages(f):
+            after += "mpitraffic_p2p({}, {}, {});\n".format(comm.name(), msg[3].name(), gen_bytes(msg))
+    else:
+        name = f.meta.fname(f.name())
+        desc = "__mpitraffic_fn_{}".format(name)
+        decl = "static struct mpitraffic_fn {} = {{\"{}\", -1}};\n\n".format(desc, name)
+        after += gen_coll_volume(f, comm, desc)
+
+    return gen_wrapper(f, before, after, decl)
+
+
+def is_part_of_bindings(f):
+    if f.name() == "MPI_Pcontrol":
+        return True
+    if not is_interposable(f):
+        return False
+    return f.name() == "MPI_Finalize" or isp2p(f) or iscoll(f)
+
+
+def backend(args):
+    # Same signatures as the header, large counts are the _c functions
+    meta = MPI_Standard_meta(lang="c", fprefix="", mpi_version=args.mpi_version, bigcount=False)
+    return MPI_Backend("traffic", meta, is_part_of_bindings, gen_traffic_wrapper, prelude=gen_prelude(meta),
+                       large_count=meta.large_count())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPI traffic matrix collector generation tool')
+    add_common_arguments(parser)
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    generate(args.datafile, [backend(args)], [args.output or sys.stdout], jobs=args.jobs, cache_dir=args.cache_dir, model_cache=args.model_cache)